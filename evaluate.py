@@ -0,0 +1,140 @@
+"""
+Multi-hour forecast accuracy of a checkpoint on the held-out split.
+
+Every test window (the last 1 - train_split of the rows, as in prepare_data)
+is rolled out `horizon` hours ahead, in batches of thousands of windows, and
+compared with the rows that actually followed. Predictions and targets are
+mapped back through the checkpoint's scaler and, when the processed CSV has
+the .range.json written by preprocess.py, through the normalization to kW.
+MAE and RMSE are reported per feature and per forecast hour, together with
+the evaluation's wall-clock time and peak memory.
+
+Usage:
+    python evaluate.py --model model_simulation/backend/model/house_consumption_model_3d.pth --json eval.json
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+
+from house_dataset import HouseConsumptionDataset
+from house_model import FeatureScaler, load_model, rollout
+from preprocess import range_path
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far, where the platform reports it"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def to_units(values, scaler, raw_range, features):
+    """Undo the training scaler, then the preprocessing normalization when its range is known"""
+    shape = values.shape
+    values = values.reshape(-1, shape[-1])
+    if scaler is not None:
+        values = scaler.inverse_transform(values)
+    if raw_range is not None:
+        low = np.array([raw_range[f]["min"] for f in features])
+        high = np.array([raw_range[f]["max"] for f in features])
+        values = values * (high - low) + low
+    return values.reshape(shape)
+
+
+def evaluate_horizons(model, device, data, seq_length=24, horizon=10, train_split=0.8,
+                      batch_size=4096, scaler=None, raw_range=None, features=None):
+    """
+    Per-feature, per-hour MAE and RMSE of `horizon`-hour rollouts over the test split.
+
+    data holds the model's input columns in the units of the processed CSV.
+    Returns a dict with (horizon, features) "mae" and "rmse" arrays and the
+    number of windows evaluated.
+    """
+    scaled = data if scaler is None else scaler.transform(data)
+    test = np.ascontiguousarray(scaled[int(len(scaled) * train_split):], dtype=np.float32)
+    dataset = HouseConsumptionDataset(test, seq_length, horizon)
+
+    abs_sum = np.zeros((horizon, test.shape[1]))
+    sq_sum = np.zeros((horizon, test.shape[1]))
+    for start in range(0, len(dataset), batch_size):
+        end = min(start + batch_size, len(dataset))
+        windows = dataset.windows[start:end]
+        targets = dataset.targets[start:end].numpy()
+        if horizon == 1:
+            targets = targets[:, None]
+        forecasts = rollout(model, windows, device, hours=horizon).cpu().numpy()
+        error = to_units(forecasts, scaler, raw_range, features) - to_units(targets, scaler, raw_range, features)
+        abs_sum += np.abs(error).sum(axis=0)
+        sq_sum += (error ** 2).sum(axis=0)
+
+    return {"windows": len(dataset), "mae": abs_sum / len(dataset), "rmse": np.sqrt(sq_sum / len(dataset))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-horizon MAE/RMSE of a checkpoint on the test split')
+    parser.add_argument('--model', default='model_simulation/backend/model/house_consumption_model_3d.pth')
+    parser.add_argument('--data', default='model_simulation/backend/data/processed_data_0101_to_1231.csv')
+    parser.add_argument('--horizon', type=int, default=10)
+    parser.add_argument('--seq-length', type=int, default=None, help='default: from the checkpoint, else 24')
+    parser.add_argument('--train-split', type=float, default=0.8)
+    parser.add_argument('--batch-size', type=int, default=4096, help='windows rolled out together')
+    parser.add_argument('--json', help='write the report to this path')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    model, metadata = load_model(args.model, map_location=device)
+    data_df = pd.read_csv(args.data, index_col=0)
+    features = metadata.get("features") or list(data_df.columns)
+    scaler = FeatureScaler.from_state_dict(metadata["scaler"]) if "scaler" in metadata else None
+    raw_range = None
+    if os.path.exists(range_path(args.data)):
+        with open(range_path(args.data)) as f:
+            raw_range = json.load(f)
+    units = 'kW' if raw_range is not None else 'normalized units'
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = evaluate_horizons(model, device, data_df[features].to_numpy(dtype=np.float64),
+                               seq_length=args.seq_length or metadata.get("seq_length") or 24,
+                               horizon=args.horizon, train_split=args.train_split,
+                               batch_size=args.batch_size, scaler=scaler, raw_range=raw_range,
+                               features=features)
+    eval_seconds = time.perf_counter() - start
+
+    print(f"{result['windows']} test windows, {args.horizon}-hour rollouts, errors in {units}")
+    for metric in ('mae', 'rmse'):
+        table = pd.DataFrame(result[metric], columns=features,
+                             index=pd.RangeIndex(1, args.horizon + 1, name='hour'))
+        print(f'\n{metric.upper()}\n{table.to_string(float_format="{:.4f}".format)}')
+    peak = peak_rss_mb()
+    print(f'\nload {load_seconds:.2f}s, evaluation {eval_seconds:.2f}s'
+          + (f', peak RSS {peak:.0f} MB' if peak is not None else ''))
+
+    if args.json:
+        report = {
+            "model": args.model,
+            "data": args.data,
+            "units": units,
+            "features": features,
+            "windows": result["windows"],
+            "mae": result["mae"].tolist(),
+            "rmse": result["rmse"].tolist(),
+            "eval_seconds": eval_seconds,
+            "peak_rss_mb": peak,
+            "peak_cuda_mb": torch.cuda.max_memory_allocated() / 2 ** 20 if device.type == 'cuda' else None
+        }
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
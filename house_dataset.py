@@ -1,17 +1,7 @@
-import torch
-from torch.utils.data import Dataset
-import pandas as pd
-import numpy as np
-from sklearn.preprocessing import MinMaxScaler
+"""
+The window dataset lives in the backend's forecasting package, shared by
+training and serving; this module keeps the training scripts' imports working.
+"""
+import house_model  # noqa: F401  (puts the forecasting package on sys.path)
 
-class HouseConsumptionDataset(Dataset):
-    def __init__(self, data, seq_length):
-        self.data = torch.FloatTensor(data)
-        self.seq_length = seq_length
-
-    def __len__(self):
-        return len(self.data) - self.seq_length
-
-    def __getitem__(self, idx):
-        return (self.data[idx:idx + self.seq_length],
-                self.data[idx + self.seq_length])
\ No newline at end of file
+from forecasting import HouseConsumptionDataset, WindowBatchSampler, window_loader  # noqa: E402
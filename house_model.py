@@ -1,19 +1,12 @@
-import torch
-import torch.nn as nn
+"""
+The model definitions live in the backend's forecasting package, shared by
+training and serving; this module keeps the training scripts' imports working.
+"""
+import os
+import sys
 
-class LSTMPredictor(nn.Module):
-    def __init__(self, input_size, hidden_size, num_layers, dropout=0.2):
-        super(LSTMPredictor, self).__init__()
-        self.lstm = nn.LSTM(
-            input_size=input_size,
-            hidden_size=hidden_size,
-            num_layers=num_layers,
-            dropout=dropout,
-            batch_first=True
-        )
-        self.linear = nn.Linear(hidden_size, input_size)
-    
-    def forward(self, x):
-        lstm_out, _ = self.lstm(x)
-        predictions = self.linear(lstm_out[:, -1, :])
-        return predictions
\ No newline at end of file
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_simulation', 'backend'))
+
+from forecasting import (  # noqa: E402
+    LSTMPredictor, DirectLSTMPredictor, FeatureScaler, save_model, load_model, read_checkpoint, rollout
+)
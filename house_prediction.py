@@ -1,14 +1,23 @@
 import torch
 import torch.nn as nn
-from torch.utils.data import DataLoader
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import MinMaxScaler
+import argparse
 import os
-from house_dataset import HouseConsumptionDataset
-from house_model import LSTMPredictor
+import random
+import time
+from house_dataset import HouseConsumptionDataset, window_loader
+from house_model import LSTMPredictor, FeatureScaler, save_model
+from ingest import ingest, house_files
+
+def load_house_data(data_path, num_houses=20, cache_dir=None, workers=None):
+    if cache_dir is not None:
+        # Parsed in parallel once, then memory-mapped from the hourly cache
+        all_data = list(ingest(house_files(data_path, num_houses), cache_dir, workers).values())
+        combined_data = pd.concat(all_data, axis=1)
+        combined_data.columns = [f'House_{i+1}' for i in range(len(all_data))]
+        return combined_data
 
-def load_house_data(data_path, num_houses=20):
     all_data = []
     
     for i in range(1, num_houses + 1):
@@ -17,58 +26,164 @@ def load_house_data(data_path, num_houses=20):
             df = pd.read_csv(file_path)
             df['datetime'] = pd.to_datetime(df['Time'])
             df.set_index('datetime', inplace=True)
-            hourly_data = df['Aggregate'].resample('H').mean()
+            hourly_data = df['Aggregate'].resample('h').mean()
             all_data.append(hourly_data)
     
     combined_data = pd.concat(all_data, axis=1)
     combined_data.columns = [f'House_{i+1}' for i in range(len(all_data))]
     return combined_data
 
-def prepare_data(data, seq_length=24, train_split=0.8):
-    scaler = MinMaxScaler()
-    scaled_data = scaler.fit_transform(data)
+def prepare_data(data, seq_length=24, train_split=0.8, horizon=1):
+    scaler = FeatureScaler()
+    scaled_data = scaler.fit_transform(data).astype(np.float32)
     
-    # Create train/test splits
+    # Create train/test splits (views of the same float32 buffer)
     train_size = int(len(scaled_data) * train_split)
     train_data = scaled_data[:train_size]
     test_data = scaled_data[train_size:]
     
     # Create datasets
-    train_dataset = HouseConsumptionDataset(train_data, seq_length)
-    test_dataset = HouseConsumptionDataset(test_data, seq_length)
+    train_dataset = HouseConsumptionDataset(train_data, seq_length, horizon)
+    test_dataset = HouseConsumptionDataset(test_data, seq_length, horizon)
     
     return train_dataset, test_dataset, scaler
 
+def evaluate(model, loader, criterion, device, bf16=False):
+    """Mean loss over loader, accumulated on-tensor with a single sync at the end"""
+    model.eval()
+    total = torch.zeros((), device=device)
+    with torch.no_grad(), torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=bf16):
+        for batch_x, batch_y in loader:
+            batch_x, batch_y = batch_x.to(device), batch_y.to(device)
+            outputs = model(batch_x)
+            total += criterion(outputs.float(), batch_y)
+    return total.item() / len(loader)
+
+def save_checkpoint(path, model, optimizer, epoch, history, best_val, stale_epochs, scaler=None):
+    """Write a resumable training checkpoint atomically"""
+    state = {
+        "model": model.state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "epoch": epoch,
+        "history": history,
+        "best_val": best_val,
+        "stale_epochs": stale_epochs,
+        "rng": {
+            "torch": torch.get_rng_state(),
+            "numpy": np.random.get_state(),
+            "python": random.getstate()
+        }
+    }
+    if scaler is not None:
+        state["scaler"] = scaler.state_dict()
+    torch.save(state, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+def load_checkpoint(path, model, optimizer):
+    """Restore model, optimizer and RNG state; returns the checkpoint dict"""
+    state = torch.load(path, map_location='cpu', weights_only=False)
+    model.load_state_dict(state["model"])
+    optimizer.load_state_dict(state["optimizer"])
+    torch.set_rng_state(state["rng"]["torch"])
+    np.random.set_state(state["rng"]["numpy"])
+    random.setstate(state["rng"]["python"])
+    return state
+
 def train_model(model, train_loader, test_loader, criterion, optimizer, 
-                num_epochs, device):
-    for epoch in range(num_epochs):
+                num_epochs, device, bf16=False, compile_model=False, val_every=1,
+                checkpoint_dir=None, checkpoint_every=1, patience=None, best_path=None, scaler=None,
+                on_epoch_end=None, metadata=None):
+    """
+    Train model and return one history entry per epoch.
+
+    bf16 runs forward passes under bfloat16 autocast, compile_model wraps the
+    model in torch.compile, and validation only runs every val_every epochs
+    (and on the last one). Losses stay on the device until the end of the
+    epoch, so there is one host sync per epoch instead of one per batch.
+
+    With checkpoint_dir, a resumable checkpoint (model, optimizer, epoch, RNG
+    state and the data scaler's min/max) is written to checkpoint_dir/last.pt
+    every checkpoint_every epochs, and training resumes from it if it exists.
+    Whenever the validation loss improves, the weights are saved to best_path
+    in the forecasting checkpoint format, with the model's architecture, the
+    scaler and `metadata` (features, seq_length) embedded. Training stops early once `patience` validations in a row
+    brought no improvement, or when on_epoch_end(history_entry) returns True.
+    """
+    history = []
+    best_val = float('inf')
+    stale_epochs = 0
+    first_epoch = 0
+
+    last_path = None
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        last_path = os.path.join(checkpoint_dir, 'last.pt')
+        if os.path.exists(last_path):
+            state = load_checkpoint(last_path, model, optimizer)
+            history, best_val, stale_epochs = state["history"], state["best_val"], state["stale_epochs"]
+            first_epoch = state["epoch"]
+            print(f'Resumed from {last_path} at epoch {first_epoch}')
+
+    forward = torch.compile(model) if compile_model else model
+
+    for epoch in range(first_epoch, num_epochs):
         model.train()
-        train_loss = 0
+        start = time.perf_counter()
+        train_loss = torch.zeros((), device=device)
+        samples = 0
         for batch_x, batch_y in train_loader:
             batch_x, batch_y = batch_x.to(device), batch_y.to(device)
-            optimizer.zero_grad()
-            outputs = model(batch_x)
-            loss = criterion(outputs, batch_y)
+            optimizer.zero_grad(set_to_none=True)
+            with torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=bf16):
+                outputs = forward(batch_x)
+            loss = criterion(outputs.float(), batch_y)
             loss.backward()
             optimizer.step()
-            train_loss += loss.item()
-        
-        # Validation
-        model.eval()
-        val_loss = 0
-        with torch.no_grad():
-            for batch_x, batch_y in test_loader:
-                batch_x, batch_y = batch_x.to(device), batch_y.to(device)
-                outputs = model(batch_x)
-                val_loss += criterion(outputs, batch_y).item()
-        
+            train_loss += loss.detach()
+            samples += len(batch_x)
+        train_loss = train_loss.item() / len(train_loader)
+        throughput = samples / (time.perf_counter() - start)
+
+        val_loss = None
+        if (epoch + 1) % val_every == 0 or epoch + 1 == num_epochs:
+            val_loss = evaluate(forward, test_loader, criterion, device, bf16)
+            if val_loss < best_val:
+                best_val = val_loss
+                stale_epochs = 0
+                if best_path is not None:
+                    save_model(best_path, model, scaler=scaler, **(metadata or {}))
+            else:
+                stale_epochs += 1
+
+        history.append({"epoch": epoch + 1, "train_loss": train_loss, "val_loss": val_loss,
+                        "samples_per_second": throughput})
         print(f'Epoch [{epoch+1}/{num_epochs}], '
-              f'Train Loss: {train_loss/len(train_loader):.4f}, '
-              f'Val Loss: {val_loss/len(test_loader):.4f}')
+              f'Train Loss: {train_loss:.4f}, '
+              + (f'Val Loss: {val_loss:.4f}, ' if val_loss is not None else '')
+              + f'Throughput: {throughput:.0f} samples/s')
+
+        stop = patience is not None and stale_epochs >= patience
+        if on_epoch_end is not None and on_epoch_end(history[-1]):
+            stop = True
+        if last_path is not None and ((epoch + 1) % checkpoint_every == 0 or stop or epoch + 1 == num_epochs):
+            save_checkpoint(last_path, model, optimizer, epoch + 1, history, best_val, stale_epochs, scaler)
+        if stop:
+            print(f'Stopping early, best Val Loss: {best_val:.4f}')
+            break
+    return history
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Train the multi-house consumption model')
+    parser.add_argument('--bf16', action='store_true', help='bfloat16 autocast for forward passes')
+    parser.add_argument('--compile', action='store_true', help='torch.compile the model')
+    parser.add_argument('--val-every', type=int, default=1, help='validate every N epochs')
+    parser.add_argument('--checkpoint-dir', default=None, help='write/resume checkpoints here')
+    parser.add_argument('--patience', type=int, default=None, help='stop after N validations without improvement')
+    args = parser.parse_args()
+
     # Parameters
     DATA_PATH = "D:/dataset/Processed_Data_CSV"
+    CACHE_DIR = "D:/dataset/cache"
     SEQ_LENGTH = 24
     HIDDEN_SIZE = 64
     NUM_LAYERS = 2
@@ -80,11 +195,11 @@ if __name__ == "__main__":
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     
     # Load and prepare data
-    data = load_house_data(DATA_PATH)
+    data = load_house_data(DATA_PATH, cache_dir=CACHE_DIR)
     train_dataset, test_dataset, scaler = prepare_data(data, SEQ_LENGTH)
     
-    train_loader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True)
-    test_loader = DataLoader(test_dataset, batch_size=BATCH_SIZE)
+    train_loader = window_loader(train_dataset, batch_size=BATCH_SIZE, shuffle=True)
+    test_loader = window_loader(test_dataset, batch_size=BATCH_SIZE)
     
     # Initialize model
     model = LSTMPredictor(
@@ -99,7 +214,7 @@ if __name__ == "__main__":
     
     # Train model
     train_model(model, train_loader, test_loader, criterion, optimizer, 
-                NUM_EPOCHS, device)
-    
-    # Save model
-    torch.save(model.state_dict(), 'house_consumption_model.pth')
\ No newline at end of file
+                NUM_EPOCHS, device, bf16=args.bf16, compile_model=args.compile,
+                val_every=args.val_every, checkpoint_dir=args.checkpoint_dir,
+                patience=args.patience, best_path='house_consumption_model.pth', scaler=scaler,
+                metadata={"features": list(data.columns), "seq_length": SEQ_LENGTH})
\ No newline at end of file
@@ -0,0 +1,123 @@
+"""
+Parallel ingestion of REFIT-style house files with an on-disk columnar cache.
+
+Each House_*.csv is parsed and resampled to hourly means once, in a process
+pool, and stored as two .npy columns (hour timestamps and values) plus an
+entry in manifest.json recording the source file's size and mtime. Later
+runs memory-map the cached columns instead of re-parsing; a house is only
+parsed again when its source file changes.
+
+Usage:
+    python ingest.py --data-path D:/dataset/Processed_Data_CSV --cache-dir D:/dataset/cache
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from preprocess import hourly_mean, DEFAULT_CHUNKSIZE
+
+MANIFEST = 'manifest.json'
+
+
+def house_files(data_path, num_houses=None):
+    """House_<n>.csv files in data_path ordered by n, optionally only House_1 .. House_<num_houses>"""
+    if num_houses is not None:
+        paths = [os.path.join(data_path, f'House_{i}.csv') for i in range(1, num_houses + 1)]
+        return [p for p in paths if os.path.exists(p)]
+    paths = glob.glob(os.path.join(data_path, 'House_*.csv'))
+    return sorted(paths, key=lambda p: int(re.findall(r'\d+', os.path.basename(p))[-1]))
+
+
+def source_signature(path, verify_hash=False):
+    stat = os.stat(path)
+    signature = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if verify_hash:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        signature["sha256"] = digest.hexdigest()
+    return signature
+
+
+def parse_house(path, chunksize=DEFAULT_CHUNKSIZE):
+    """Hourly mean of the Aggregate column of one house file"""
+    def chunks():
+        for chunk in pd.read_csv(path, chunksize=chunksize, usecols=['Time', 'Aggregate']):
+            index = pd.DatetimeIndex(pd.to_datetime(chunk['Time']))
+            yield pd.Series(chunk['Aggregate'].to_numpy(dtype=np.float64), index=index)
+    return hourly_mean(chunks())
+
+
+def _ingest_one(path, cache_dir, chunksize):
+    # Runs in a worker process: parse, then write the columns atomically
+    hourly = parse_house(path, chunksize)
+    name = os.path.splitext(os.path.basename(path))[0]
+    for column, values in (('index', hourly.index.values.astype('datetime64[ns]')),
+                           ('values', hourly.to_numpy(dtype=np.float64))):
+        target = os.path.join(cache_dir, f'{name}.{column}.npy')
+        np.save(target + '.tmp.npy', values)
+        os.replace(target + '.tmp.npy', target)
+    return name
+
+
+def load_cached(cache_dir, name):
+    """Hourly Series of one cached house, memory-mapped from its .npy columns"""
+    index = np.load(os.path.join(cache_dir, f'{name}.index.npy'), mmap_mode='r')
+    values = np.load(os.path.join(cache_dir, f'{name}.values.npy'), mmap_mode='r')
+    return pd.Series(values, index=pd.DatetimeIndex(index), name=name)
+
+
+def ingest(paths, cache_dir, workers=None, chunksize=DEFAULT_CHUNKSIZE, verify_hash=False):
+    """
+    Make sure every file in paths is cached and return {house name: hourly Series}.
+
+    Stale or missing houses are parsed in a process pool of `workers` processes.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest_path = os.path.join(cache_dir, MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    names = [os.path.splitext(os.path.basename(p))[0] for p in paths]
+    signatures = {name: source_signature(p, verify_hash) for name, p in zip(names, paths)}
+    stale = [p for name, p in zip(names, paths)
+             if manifest.get(name) != signatures[name]
+             or not os.path.exists(os.path.join(cache_dir, f'{name}.values.npy'))]
+
+    if stale:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for name in pool.map(_ingest_one, stale, [cache_dir] * len(stale), [chunksize] * len(stale)):
+                manifest[name] = signatures[name]
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+    return {name: load_cached(cache_dir, name) for name in names}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest house files into the hourly columnar cache')
+    parser.add_argument('--data-path', default='D:/dataset/Processed_Data_CSV')
+    parser.add_argument('--cache-dir', default='D:/dataset/cache')
+    parser.add_argument('--num-houses', type=int, default=None, help='default: every House_*.csv')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--verify-hash', action='store_true', help='also compare source file hashes')
+    args = parser.parse_args()
+
+    houses = ingest(house_files(args.data_path, args.num_houses), args.cache_dir,
+                    workers=args.workers, verify_hash=args.verify_hash)
+    print(f"Cached {len(houses)} houses in {args.cache_dir}")
+
+
+if __name__ == '__main__':
+    main()
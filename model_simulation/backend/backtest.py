@@ -0,0 +1,133 @@
+"""
+Headless backtest of the trading policy over a processed dataset.
+
+Replays every row of the CSV as fast as possible instead of one hour per
+second: all forecasts are computed up front in batched rollouts (through the
+forecast cache), then the storage is stepped hour by hour applying the
+policy's buy/sell recommendation.
+
+The policy is the one /ws serves (policy.calculate_trade_action) and the
+storage is a ledger account with the served rules: every hour settles the
+net generation unclamped, like the engines' update_storage, a sale is a
+withdrawal that only goes through when the balance covers it, like
+/purchase, and a buy is credited. The ledger is a scratch database
+that is removed afterwards. Each hour's decision depends on the storage the previous ones
+left, so the stepping is sequential; only the per-hour inputs are
+precomputed as arrays.
+
+Usage:
+    python backtest.py --data data/processed_data_0101_to_1231.csv --json report.json
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from forecast_cache import ForecastCache
+from ledger import Ledger
+from policy import calculate_trade_action
+from predict import load_model, FEATURES
+
+
+def load_dataset(path):
+    data_df = pd.read_csv(path, index_col=0)
+    return data_df[FEATURES].to_numpy(dtype=np.float32)
+
+
+def run_backtest(data, forecasts, policy=calculate_trade_action, initial_storage=5.0, capacity=30.0):
+    """
+    Step a ledger account through every row of data, applying the policy each hour.
+
+    forecasts[i] is the (horizon, 3) forecast made at row i. capacity is only
+    used to count the hours the unclamped storage spends above it.
+    """
+    rows = [dict(zip(FEATURES, row)) for row in data.tolist()]
+    predictions = [[dict(zip(FEATURES, row)) for row in forecast] for forecast in np.asarray(forecasts).tolist()]
+
+    scratch = tempfile.TemporaryDirectory(prefix='backtest-')
+    ledger = Ledger(os.path.join(scratch.name, 'ledger.db'), synchronous='OFF')
+    account = ledger.account('backtest', initial_storage)
+
+    storages = np.empty(len(data))
+    actions = {'buy': 0, 'sell': 0, 'hold': 0}
+    bought = sold = 0.0
+    rejected = 0
+    confidence = 0.0
+
+    for i in range(len(data)):
+        account.update_storage(wind_generation=rows[i]['P_wind'], solar_generation=rows[i]['P_solar'],
+                               consumption=rows[i]['house_consumption'])
+
+        recommendation, _ = policy(account.storage, predictions[i])
+        action, amount = recommendation['action'], recommendation['amount']
+        actions[action] += 1
+        confidence += recommendation['confidence']
+
+        if action == 'buy' and amount > 0:
+            ledger.settle(account.name, amount, kind='buy')
+            bought += amount
+        elif action == 'sell' and amount > 0:
+            if account.purchase_energy(amount):
+                sold += amount
+            else:
+                rejected += 1
+        storages[i] = account.storage
+
+    final_storage = account.storage
+    ledger.close()
+    scratch.cleanup()
+    hours = len(data)
+    return {
+        "hours": hours,
+        "initial_storage": initial_storage,
+        "final_storage": final_storage,
+        "bought_kwh": bought,
+        "sold_kwh": sold,
+        "rejected_sales": rejected,
+        "min_storage": float(storages.min()) if hours else initial_storage,
+        "max_storage": float(storages.max()) if hours else initial_storage,
+        "hours_empty": int(np.sum(storages <= 0)),
+        "hours_over_capacity": int(np.sum(storages > capacity)),
+        "mean_storage": float(storages.mean()) if hours else initial_storage,
+        "actions": actions,
+        "mean_confidence": confidence / hours if hours else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fast-forward backtest of the trading policy')
+    parser.add_argument('--data', default='data/processed_data_0101_to_1231.csv')
+    parser.add_argument('--model', default='model/house_consumption_model_3d.pth')
+    parser.add_argument('--horizon', type=int, default=10)
+    parser.add_argument('--initial-storage', type=float, default=5.0)
+    parser.add_argument('--capacity', type=float, default=30.0)
+    parser.add_argument('--no-cache', action='store_true', help='do not persist/reuse the forecast table')
+    parser.add_argument('--json', help='write the report to this path')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    data = load_dataset(args.data)
+    model, device = load_model(args.model)
+    cache = ForecastCache(args.model, data, horizon=args.horizon, persist=not args.no_cache)
+    cache.precompute(model, device)
+    forecast_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    report = run_backtest(data, cache.table, initial_storage=args.initial_storage, capacity=args.capacity)
+    report["checkpoint"] = cache.checkpoint
+    report["forecast_seconds"] = forecast_seconds
+    report["simulation_seconds"] = time.perf_counter() - start
+
+    for key, value in report.items():
+        print(f'{key}: {value}')
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,7 @@
+import os
+
+import numpy as np
+
 class EnergyStorage:
     def __init__(self, initial_storage=800):
         self.storage = initial_storage
@@ -12,3 +16,90 @@ class EnergyStorage:
             self.storage -= amount
             return True
         return False
+
+
+class FleetStorage:
+    """
+    Batteries of many households stored as NumPy arrays.
+
+    initial_storage and capacity may be scalars or per-household arrays.
+    Unlike EnergyStorage, the storage is clamped to [0, capacity].
+    """
+    def __init__(self, num_households, initial_storage=5, capacity=30):
+        self.initial_storage = np.broadcast_to(np.asarray(initial_storage, dtype=np.float64), (num_households,)).copy()
+        self.capacity = np.broadcast_to(np.asarray(capacity, dtype=np.float64), (num_households,)).copy()
+        self.storage = np.minimum(self.initial_storage, self.capacity)
+
+    def __len__(self):
+        return len(self.storage)
+
+    def update_storage(self, wind_generation, solar_generation, consumption):
+        net_storage_change = wind_generation + solar_generation - consumption
+        np.clip(self.storage + net_storage_change, 0, self.capacity, out=self.storage)
+
+    def charge(self, amount):
+        """Add energy where it fits and return the amount actually stored"""
+        stored = np.clip(amount, 0, self.capacity - self.storage)
+        self.storage += stored
+        return stored
+
+    def purchase_energy(self, amount):
+        """Withdraw amount from every household that holds enough; returns the success mask"""
+        amount = np.broadcast_to(np.asarray(amount, dtype=np.float64), self.storage.shape)
+        success = self.storage >= amount
+        self.storage -= np.where(success, amount, 0)
+        return success
+
+
+class HistoryBuffer:
+    """
+    Preallocated ring buffer holding the last seq_length observed rows.
+
+    Every row is written twice, seq_length slots apart, so the chronological
+    window is always one contiguous slice of the buffer and can be handed to
+    the model as a view without copying.
+
+    With batch_shape=(N,) it holds N histories stepped in lockstep, rows are
+    (N, num_features) and window() is an (N, seq_length, num_features) view.
+    """
+    def __init__(self, seq_length=24, num_features=3, batch_shape=()):
+        self.seq_length = seq_length
+        self.batch_shape = tuple(batch_shape)
+        self.buffer = np.zeros(self.batch_shape + (2 * seq_length, num_features), dtype=np.float32)
+        self.pos = 0
+
+    def append(self, row):
+        self.buffer[..., self.pos, :] = row
+        self.buffer[..., self.pos + self.seq_length, :] = row
+        self.pos = (self.pos + 1) % self.seq_length
+
+    def window(self):
+        """(*batch_shape, seq_length, num_features) view, oldest row first"""
+        return self.buffer[..., self.pos:self.pos + self.seq_length, :]
+
+
+def history_window(data, index, seq_length=24):
+    """Model input window for replay row `index`: the seq_length rows up to and including it"""
+    rows = np.arange(index - seq_length + 1, index + 1) % len(data)
+    return data[rows]
+
+
+def load_replay_data(csv_path, columns, cache=True):
+    """
+    Replay rows of a processed CSV as one compact (rows, len(columns)) float32 array.
+
+    With cache=True the array is also written as a .npy next to the CSV, keyed
+    by the CSV's size and mtime, and later calls memory-map it read-only
+    instead of parsing the CSV again.
+    """
+    stat = os.stat(csv_path)
+    cache_path = f'{os.path.splitext(csv_path)[0]}.{stat.st_size:x}_{stat.st_mtime_ns:x}.npy'
+    if cache and os.path.exists(cache_path):
+        return np.load(cache_path, mmap_mode='r')
+
+    import pandas as pd
+    data = pd.read_csv(csv_path, usecols=columns, dtype=np.float32)[columns].to_numpy()
+    if cache:
+        np.save(cache_path + '.tmp.npy', data)
+        os.replace(cache_path + '.tmp.npy', cache_path)
+    return data
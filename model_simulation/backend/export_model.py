@@ -0,0 +1,140 @@
+"""
+Export a checkpoint as CPU inference artifacts and check them against fp32.
+
+Writes next to the checkpoint (or into --out-dir):
+
+- <name>.ts       TorchScript of the fp32 model
+- <name>.int8.ts  TorchScript of the model with nn.LSTM / nn.Linear
+                  dynamically quantized to int8
+
+Both load without the model's Python class via MODEL_PATH=<artifact> (see
+predict.load_model). For every artifact the parity check reports the maximum
+absolute deviation of its 10-hour rollouts from the fp32 checkpoint over the
+whole dataset, the median single-window latency, and the resident memory a
+fresh worker process needs to load it and serve one forecast.
+
+Usage:
+    python export_model.py --model model/house_consumption_model_3d.pth
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import time
+
+import numpy as np
+import torch
+
+from backtest import load_dataset
+from data_handler import history_window
+from forecasting import read_checkpoint
+from predict import load_model, quantize, rollout
+
+
+def export(model_path, out_dir=None):
+    """Write the fp32 and int8 TorchScript artifacts, returning {name: path}"""
+    model, _ = load_model(model_path)
+    model = model.cpu()
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    out_dir = out_dir or os.path.dirname(model_path)
+    metadata = {**read_checkpoint(model_path)[0], "source": os.path.basename(model_path)}
+    # load_model folded the scaler into the weights; the artifacts take raw rows
+    metadata.pop("scaler", None)
+
+    artifacts = {}
+    for name, variant, suffix in (('torchscript', model, '.ts'), ('int8', quantize(model), '.int8.ts')):
+        path = os.path.join(out_dir, stem + suffix)
+        extra = {"metadata.json": json.dumps({**metadata, "quantized": name == 'int8'})}
+        torch.jit.save(torch.jit.script(variant), path + '.tmp', _extra_files=extra)
+        os.replace(path + '.tmp', path)
+        artifacts[name] = path
+    return artifacts
+
+
+def _rss_mb():
+    # Resident set size of this process, Linux only
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _worker_memory(model_path, window):
+    # Runs in a fresh process: memory after importing torch, then after loading and one forecast
+    torch.set_num_threads(1)
+    before = _rss_mb()
+    model, device = load_model(model_path)
+    rollout(model, window, device)
+    after = _rss_mb()
+    return before, after
+
+
+def resident_memory(model_path, window):
+    """(baseline, loaded) resident MB of a fresh worker process serving model_path"""
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(_worker_memory, (model_path, window))
+
+
+def median_latency_ms(model, device, window, runs=100):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        rollout(model, window, device)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def parity(model_path, artifacts, data, batch_size=512):
+    """Per-artifact max |deviation| from the fp32 rollouts, latency and worker memory"""
+    windows = np.stack([history_window(data, i) for i in range(len(data))])
+    reference, device = load_model(model_path)
+    expected = torch.cat([rollout(reference, windows[i:i + batch_size], device).cpu()
+                          for i in range(0, len(windows), batch_size)])
+
+    report = {}
+    for name, path in [('fp32', model_path)] + list(artifacts.items()):
+        model, device = load_model(path)
+        forecasts = torch.cat([rollout(model, windows[i:i + batch_size], device).cpu()
+                               for i in range(0, len(windows), batch_size)])
+        baseline, loaded = resident_memory(path, windows[0])
+        report[name] = {
+            "path": path,
+            "size_kb": os.path.getsize(path) / 1024,
+            "max_abs_deviation": float((forecasts - expected).abs().max()),
+            "mean_abs_deviation": float((forecasts - expected).abs().mean()),
+            "latency_ms": median_latency_ms(model, device, windows[0]),
+            "worker_rss_mb": loaded,
+            "model_rss_mb": loaded - baseline if loaded is not None else None
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export TorchScript and int8 inference artifacts')
+    parser.add_argument('--model', default='model/house_consumption_model_3d.pth')
+    parser.add_argument('--out-dir', default=None, help='default: next to the checkpoint')
+    parser.add_argument('--data', default='data/processed_data_0101_to_1231.csv')
+    parser.add_argument('--no-parity', action='store_true', help='only write the artifacts')
+    args = parser.parse_args()
+
+    artifacts = export(args.model, args.out_dir)
+    for name, path in artifacts.items():
+        print(f'{name}: {path}')
+    if args.no_parity:
+        return
+
+    for name, row in parity(args.model, artifacts, load_dataset(args.data)).items():
+        memory = ''
+        if row['worker_rss_mb'] is not None:
+            memory = f", worker RSS {row['worker_rss_mb']:.0f} MB (model {row['model_rss_mb']:.1f} MB)"
+        print(f"{name:>11}: max |dev| {row['max_abs_deviation']:.5f} (mean {row['mean_abs_deviation']:.5f}), "
+              f"latency {row['latency_ms']:.2f} ms, {row['size_kb']:.0f} KB{memory}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from data_handler import history_window
+from predict import rollout
+
+
+def checkpoint_hash(model_path):
+    """Short content hash of a checkpoint file, used to key cached forecasts"""
+    digest = hashlib.sha256()
+    with open(model_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def data_hash(data, seq_length):
+    """Short hash of the replayed rows and window length the forecasts were made from"""
+    digest = hashlib.sha256(np.ascontiguousarray(data).tobytes())
+    digest.update(str(seq_length).encode())
+    return digest.hexdigest()[:8]
+
+
+class ForecastCache:
+    """
+    Forecasts for the replayed dataset keyed by (checkpoint hash, variant, row index, horizon).
+
+    variant names how the checkpoint is served when that changes its outputs,
+    e.g. 'int8' for a checkpoint quantized at load time, so the fp32 and int8
+    forecasts never share a table.
+
+    The replay loops over the same rows forever, so every forecast only has to
+    be computed once per checkpoint. Two modes are supported:
+
+    - 'precompute': fill a (rows, horizon, 3) table in one batched pass and
+      optionally persist it as a memory-mapped .npy next to the model. With
+      persist=False a table on disk is neither reused nor written.
+    - 'lru': fill lazily from served forecasts and evict the least recently
+      used rows once max_mb is reached.
+    """
+
+    def __init__(self, model_path, data, horizon=10, mode='precompute', max_mb=64,
+                 persist=True, seq_length=24, variant=None):
+        self.data = data
+        self.horizon = horizon
+        self.mode = mode
+        self.persist = persist
+        self.seq_length = seq_length
+        self.checkpoint = checkpoint_hash(model_path)
+        self.variant = variant
+
+        suffix = f'_{variant}' if variant else ''
+        name = f'forecast_cache_{self.checkpoint}_{data_hash(data, seq_length)}_h{horizon}{suffix}.npy'
+        self.path = os.path.join(os.path.dirname(model_path), name)
+
+        entry_bytes = horizon * data.shape[1] * 4
+        self.max_entries = max(1, int(max_mb * 1024 * 1024 // entry_bytes))
+        self.table = None
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, index):
+        return (self.checkpoint, self.variant, index % len(self.data), self.horizon)
+
+    def get(self, index, hours=None):
+        """Cached (hours, 3) forecast for a replay row, or None on a miss"""
+        hours = hours or self.horizon
+        if hours > self.horizon:
+            return None
+
+        if self.table is not None:
+            self.hits += 1
+            return self.table[index % len(self.data), :hours]
+
+        with self.lock:
+            forecast = self.entries.get(self.key(index))
+            if forecast is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(self.key(index))
+            self.hits += 1
+            return forecast[:hours]
+
+    def put(self, index, forecast):
+        if self.mode != 'lru' or len(forecast) < self.horizon:
+            return
+        with self.lock:
+            self.entries[self.key(index)] = np.asarray(forecast[:self.horizon], dtype=np.float32)
+            self.entries.move_to_end(self.key(index))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def load(self):
+        """Memory-map a previously persisted table if one matches this checkpoint"""
+        if not os.path.exists(self.path):
+            return False
+        table = np.load(self.path, mmap_mode='r')
+        if table.shape != (len(self.data), self.horizon, self.data.shape[1]):
+            return False
+        self.table = table
+        return True
+
+    def precompute(self, model, device, batch_size=512):
+        """Forecast every row in batched rollouts and publish the table"""
+        if self.persist and self.load():
+            return
+
+        table = np.empty((len(self.data), self.horizon, self.data.shape[1]), dtype=np.float32)
+        for start in range(0, len(self.data), batch_size):
+            rows = range(start, min(start + batch_size, len(self.data)))
+            windows = np.stack([history_window(self.data, i, self.seq_length) for i in rows])
+            table[start:start + len(rows)] = rollout(model, windows, device, hours=self.horizon).cpu().numpy()
+
+        if self.persist:
+            tmp_path = self.path + '.tmp.npy'
+            np.save(tmp_path, table)
+            os.replace(tmp_path, self.path)
+        self.table = table
+
+    def metrics(self):
+        return {
+            "mode": self.mode,
+            "checkpoint": self.checkpoint,
+            "variant": self.variant,
+            "horizon": self.horizon,
+            "ready": self.table is not None,
+            "entries": len(self.data) if self.table is not None else len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses
+        }
@@ -0,0 +1,19 @@
+"""
+LSTM forecasting model, dataset, scaler and checkpoint format.
+
+Training (the scripts at the repository root) and serving (this backend)
+both import from here, so there is one definition of each.
+"""
+from .model import LSTMPredictor, DirectLSTMPredictor, build_model, fold_scaler, unfold_scaler
+from .dataset import HouseConsumptionDataset, WindowBatchSampler, window_loader
+from .scaler import FeatureScaler
+from .checkpoint import FORMAT_VERSION, save_model, read_checkpoint, load_model
+from .inference import rollout
+
+__all__ = [
+    "LSTMPredictor", "DirectLSTMPredictor", "build_model", "fold_scaler", "unfold_scaler",
+    "HouseConsumptionDataset", "WindowBatchSampler", "window_loader",
+    "FeatureScaler",
+    "FORMAT_VERSION", "save_model", "read_checkpoint", "load_model",
+    "rollout",
+]
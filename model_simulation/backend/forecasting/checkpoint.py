@@ -0,0 +1,66 @@
+"""
+The model checkpoint format shared by training and serving.
+
+A checkpoint is a torch.save'd dict
+
+    {"format_version": 1,
+     "metadata": {"architecture", "input_size", "hidden_size", "num_layers",
+                  "dropout", ["horizon"], "features", "seq_length",
+                  "scaler": {"data_min", "data_max"}},
+     "state_dict": ...}
+
+holding only tensors and plain Python values, so it loads with
+torch.load(weights_only=True). Older checkpoints that are a bare state_dict
+still load: their architecture is read off the weight shapes instead of
+being assumed.
+"""
+import os
+
+import torch
+
+from .model import build_model
+
+FORMAT_VERSION = 1
+
+def save_model(path, model, scaler=None, features=None, seq_length=None, **extra):
+    """Write model weights and their metadata atomically"""
+    metadata = {**model.config(), "features": features, "seq_length": seq_length, **extra}
+    if scaler is not None:
+        metadata["scaler"] = scaler.state_dict()
+    state = {"format_version": FORMAT_VERSION, "metadata": metadata,
+             "state_dict": {k: v.detach().cpu() for k, v in model.state_dict().items()}}
+    torch.save(state, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+def infer_config(state_dict):
+    """Architecture config of a bare LSTMPredictor / DirectLSTMPredictor state_dict"""
+    hidden_size = state_dict['lstm.weight_hh_l0'].shape[1]
+    input_size = state_dict['lstm.weight_ih_l0'].shape[1]
+    num_layers = sum(1 for key in state_dict if key.startswith('lstm.weight_ih_l'))
+    outputs = state_dict['linear.weight'].shape[0]
+    config = {"architecture": "recursive", "input_size": input_size,
+              "hidden_size": hidden_size, "num_layers": num_layers}
+    if outputs != input_size:
+        config.update(architecture="direct", horizon=outputs // input_size)
+    return config
+
+def read_checkpoint(path, map_location='cpu'):
+    """(metadata, state_dict) of a checkpoint in either format"""
+    state = torch.load(path, map_location=map_location, weights_only=True)
+    if "state_dict" in state and "metadata" in state:
+        metadata = dict(state["metadata"])
+        # Checkpoints written before the format was versioned lack the size keys
+        metadata = {**infer_config(state["state_dict"]), **metadata}
+        return metadata, state["state_dict"]
+    return infer_config(state), state
+
+def load_model(path, map_location='cpu'):
+    """(model in eval mode, metadata) for a checkpoint"""
+    metadata, state_dict = read_checkpoint(path, map_location)
+    config = {k: metadata[k] for k in ('architecture', 'input_size', 'hidden_size', 'num_layers',
+                                       'dropout', 'horizon') if k in metadata}
+    model = build_model(config)
+    model.load_state_dict(state_dict)
+    model.to(map_location)
+    model.eval()
+    return model, metadata
@@ -0,0 +1,72 @@
+import torch
+from torch.utils.data import Dataset, DataLoader, Sampler
+import numpy as np
+
+class HouseConsumptionDataset(Dataset):
+    """
+    Every (seq_length, features) window of a series and the row that follows it.
+
+    The windows are one strided view (unfold) over a single float32 buffer, so
+    no window is ever copied until a batch is gathered. A float32 NumPy array
+    or np.memmap is wrapped without copying, which lets datasets larger than
+    RAM be paged in on demand. Indexing with a tensor of indices gathers a
+    whole batch in one operation (see WindowBatchSampler).
+
+    With horizon > 1 the target is the (horizon, features) block of rows that
+    follows each window, for training a direct multi-horizon head.
+    """
+    def __init__(self, data, seq_length, horizon=1):
+        if isinstance(data, torch.Tensor):
+            self.data = data.float()
+        else:
+            self.data = torch.from_numpy(np.asarray(data, dtype=np.float32))
+        self.seq_length = seq_length
+        self.horizon = horizon
+        # (num_windows, seq_length, features) view, no copy
+        self.windows = self.data.unfold(0, seq_length, 1).transpose(1, 2)
+        if horizon == 1:
+            self.targets = self.data[seq_length:]
+        else:
+            self.targets = self.data[seq_length:].unfold(0, horizon, 1).transpose(1, 2)
+
+    @classmethod
+    def from_npy(cls, path, seq_length, horizon=1):
+        """Windows over a float32 .npy file, memory-mapped copy-on-write"""
+        return cls(np.load(path, mmap_mode='c'), seq_length, horizon)
+
+    def __len__(self):
+        return len(self.data) - self.seq_length - self.horizon + 1
+
+    def __getitem__(self, idx):
+        return (self.windows[idx].contiguous(),
+                self.targets[idx])
+
+class WindowBatchSampler(Sampler):
+    """Yields one index tensor per batch so the dataset gathers the batch in a single indexing op"""
+    def __init__(self, num_samples, batch_size, shuffle=False, drop_last=False, generator=None):
+        self.num_samples = num_samples
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.generator = generator
+
+    def __iter__(self):
+        if self.shuffle:
+            order = torch.randperm(self.num_samples, generator=self.generator)
+        else:
+            order = torch.arange(self.num_samples)
+        for batch in order.split(self.batch_size):
+            if self.drop_last and len(batch) < self.batch_size:
+                break
+            yield batch
+
+    def __len__(self):
+        if self.drop_last:
+            return self.num_samples // self.batch_size
+        return (self.num_samples + self.batch_size - 1) // self.batch_size
+
+def window_loader(dataset, batch_size, shuffle=False, drop_last=False, generator=None):
+    """DataLoader that fetches whole batches from a HouseConsumptionDataset without per-item collation"""
+    sampler = WindowBatchSampler(len(dataset), batch_size, shuffle, drop_last, generator)
+    # batch_size=None disables automatic batching: each sampled index tensor is one batch
+    return DataLoader(dataset, sampler=sampler, batch_size=None)
@@ -0,0 +1,34 @@
+import torch
+
+def rollout(model, history, device, hours=10):
+    """
+    Autoregressively forecast `hours` steps from a history window.
+
+    history is a (seq_length, 3) or (batch, seq_length, 3) array/tensor and the
+    result is a (batch, hours, 3) tensor that stays on `device`.
+
+    Every step re-runs the model over the last seq_length rows for the whole
+    batch at once, exactly like the original sliding-window loop.
+
+    A DirectLSTMPredictor produces model.horizon hours per forward pass, so a
+    forecast up to its horizon is a single call; longer ones feed whole blocks
+    back into the window.
+    """
+    with torch.no_grad():
+        window = torch.as_tensor(history, dtype=torch.float32, device=device)
+        if window.dim() == 2:
+            window = window.unsqueeze(0)
+        out = torch.empty(window.size(0), hours, window.size(2), device=device)
+
+        direct = getattr(model, 'horizon', None)
+        if direct:
+            for t in range(0, hours, direct):
+                block = model(window)[:, :hours - t]
+                out[:, t:t + block.size(1)] = block
+                window = torch.cat((window, block), dim=1)[:, -window.size(1):]
+        else:
+            for t in range(hours):
+                pred = model(window)
+                out[:, t] = pred
+                window = torch.cat((window[:, 1:], pred.unsqueeze(1)), dim=1)
+    return out
@@ -0,0 +1,81 @@
+import torch
+import torch.nn as nn
+
+class LSTMPredictor(nn.Module):
+    """Next-hour forecaster: an LSTM over a (batch, seq_length, features) window and a linear head"""
+    architecture = 'recursive'
+
+    def __init__(self, input_size=3, hidden_size=64, num_layers=2, dropout=0.2):
+        super(LSTMPredictor, self).__init__()
+        self.input_size = input_size
+        self.hidden_size = hidden_size
+        self.num_layers = num_layers
+        self.dropout = dropout
+        self.lstm = nn.LSTM(
+            input_size=input_size,
+            hidden_size=hidden_size,
+            num_layers=num_layers,
+            dropout=dropout,
+            batch_first=True
+        )
+        self.linear = nn.Linear(hidden_size, input_size)
+
+    def forward(self, x):
+        lstm_out, _ = self.lstm(x)
+        predictions = self.linear(lstm_out[:, -1, :])
+        return predictions
+
+    def config(self):
+        """Constructor arguments, as stored in checkpoint metadata"""
+        return {"architecture": self.architecture, "input_size": self.input_size,
+                "hidden_size": self.hidden_size, "num_layers": self.num_layers, "dropout": self.dropout}
+
+class DirectLSTMPredictor(LSTMPredictor):
+    """LSTMPredictor whose head emits the next `horizon` rows at once as a (batch, horizon, input_size) block"""
+    architecture = 'direct'
+
+    def __init__(self, input_size=3, hidden_size=64, num_layers=2, dropout=0.2, horizon=10):
+        super(DirectLSTMPredictor, self).__init__(input_size, hidden_size, num_layers, dropout)
+        self.horizon = horizon
+        self.linear = nn.Linear(hidden_size, input_size * horizon)
+
+    def forward(self, x):
+        lstm_out, _ = self.lstm(x)
+        return self.linear(lstm_out[:, -1, :]).view(x.size(0), self.horizon, -1)
+
+    def config(self):
+        return {**super(DirectLSTMPredictor, self).config(), "horizon": self.horizon}
+
+ARCHITECTURES = {cls.architecture: cls for cls in (LSTMPredictor, DirectLSTMPredictor)}
+
+def build_model(config):
+    """Instantiate the architecture described by a config() dict"""
+    config = dict(config)
+    return ARCHITECTURES[config.pop("architecture", "recursive")](**config)
+
+def _affine(model, scaler):
+    # transform(x) = x * scale + shift, per feature
+    scale = torch.as_tensor(scaler.scale, dtype=torch.float32)
+    shift = torch.as_tensor(-scaler.data_min * scaler.scale, dtype=torch.float32)
+    blocks = model.linear.out_features // model.input_size
+    return scale, shift, scale.repeat(blocks), shift.repeat(blocks)
+
+def fold_scaler(model, scaler):
+    """Rewrite, in place, a model trained on scaler.transform(rows) to take and return raw rows"""
+    scale, shift, out_scale, out_shift = _affine(model, scaler)
+    with torch.no_grad():
+        model.lstm.bias_ih_l0 += model.lstm.weight_ih_l0 @ shift
+        model.lstm.weight_ih_l0 *= scale
+        model.linear.weight /= out_scale[:, None]
+        model.linear.bias.sub_(out_shift).div_(out_scale)
+    return model
+
+def unfold_scaler(model, scaler):
+    """Inverse of fold_scaler: a raw-row model rewritten to work on scaler.transform(rows)"""
+    scale, shift, out_scale, out_shift = _affine(model, scaler)
+    with torch.no_grad():
+        model.lstm.weight_ih_l0 /= scale
+        model.lstm.bias_ih_l0 -= model.lstm.weight_ih_l0 @ shift
+        model.linear.weight *= out_scale[:, None]
+        model.linear.bias.mul_(out_scale).add_(out_shift)
+    return model
@@ -0,0 +1,50 @@
+import numpy as np
+
+class FeatureScaler:
+    """
+    Per-feature min/max scaling to [0, 1], numerically matching sklearn's MinMaxScaler.
+
+    Only data_min and data_max are state, so a scaler round-trips through
+    checkpoint metadata as two plain lists.
+    """
+    def __init__(self, data_min=None, data_max=None):
+        self.data_min = None if data_min is None else np.asarray(data_min, dtype=np.float64)
+        self.data_max = None if data_max is None else np.asarray(data_max, dtype=np.float64)
+
+    def fit(self, data):
+        data = np.asarray(data, dtype=np.float64)
+        self.data_min = np.nanmin(data, axis=0)
+        self.data_max = np.nanmax(data, axis=0)
+        return self
+
+    def partial_fit(self, data):
+        """Widen the running min/max with more rows, as when data arrives as a stream"""
+        data = np.asarray(data, dtype=np.float64).reshape(-1, np.shape(data)[-1])
+        if self.data_min is None:
+            return self.fit(data)
+        self.data_min = np.fmin(self.data_min, np.nanmin(data, axis=0))
+        self.data_max = np.fmax(self.data_max, np.nanmax(data, axis=0))
+        return self
+
+    def fit_transform(self, data):
+        return self.fit(data).transform(data)
+
+    @property
+    def scale(self):
+        data_range = self.data_max - self.data_min
+        # Constant features are left unscaled instead of dividing by zero
+        return 1.0 / np.where(data_range == 0, 1.0, data_range)
+
+    def transform(self, data):
+        scale = self.scale
+        return np.asarray(data, dtype=np.float64) * scale - self.data_min * scale
+
+    def inverse_transform(self, data):
+        return (np.asarray(data, dtype=np.float64) + self.data_min * self.scale) / self.scale
+
+    def state_dict(self):
+        return {"data_min": self.data_min.tolist(), "data_max": self.data_max.tolist()}
+
+    @classmethod
+    def from_state_dict(cls, state):
+        return cls(state["data_min"], state["data_max"])
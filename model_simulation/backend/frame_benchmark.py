@@ -0,0 +1,101 @@
+"""
+Bytes per tick and serialization CPU time of the /ws wire formats.
+
+Replays --ticks hours through a headless SimulationEngine (forecasts from the
+precomputed cache, bootstrap risk, the server's trade policy) and encodes
+every payload as:
+
+- json:       the previous encoder, stdlib json.dumps
+- json-fast:  frames.dumps (orjson when installed)
+- keyframe:   the binary layout with every field
+- delta:      the binary stream a session actually receives
+
+Usage:
+    python frame_benchmark.py --ticks 2000
+"""
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from data_handler import EnergyStorage, load_replay_data
+from forecast_cache import ForecastCache
+from frames import dumps, orjson
+from main import model_path
+from policy import REASON_TEMPLATES, calculate_trade_action
+from predict import FEATURES, load_model
+from scenarios import ScenarioEngine
+from simulation import SimulationEngine
+
+
+async def replay(engine, ticks):
+    return [await engine.tick() for _ in range(ticks)]
+
+
+def measure(encode, items, repeat=3):
+    """(mean bytes, mean microseconds) per item, best of `repeat` passes"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        encoded = [encode(item) for item in items]
+        best = min(best, time.perf_counter() - start)
+    sizes = [len(e.encode() if isinstance(e, str) else e) for e in encoded]
+    return sum(sizes) / len(sizes), best / len(items) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare /ws frame sizes and encoding cost')
+    parser.add_argument('--data', default='data/processed_data_0101_to_1231.csv')
+    parser.add_argument('--ticks', type=int, default=2000)
+    args = parser.parse_args()
+
+    data = load_replay_data(args.data, FEATURES)
+    model, device = load_model(model_path)
+    cache = ForecastCache(model_path, data, horizon=10)
+    cache.precompute(model, device)
+    risk = ScenarioEngine(method='bootstrap', model=model, device=device, seed=0)
+    risk.fit_residuals(data, cache.table)
+    datetime_index = pd.date_range('2025-01-01', periods=len(data), freq='h')
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        engine = SimulationEngine('benchmark', data, datetime_index, EnergyStorage(initial_storage=5),
+                                  None, executor, calculate_trade_action, cache=cache, risk=risk,
+                                  reason_templates=REASON_TEMPLATES)
+        payloads = asyncio.run(replay(engine, args.ticks))
+
+    codec = engine.codec
+    flat = [codec.flatten(payload) for payload in payloads]
+    pairs = list(zip(range(len(flat)), flat, [None] + flat[:-1]))
+
+    def keyframe(item):
+        tick, (values, action, reason, has_risk), _ = item
+        return codec.encode(tick, values, action, reason, has_risk)
+
+    def delta(item):
+        tick, (values, action, reason, has_risk), previous = item
+        if previous is None:
+            return codec.encode(tick, values, action, reason, has_risk)
+        return codec.encode(tick, values, action, reason, has_risk, previous[0], previous[2])
+
+    flatten_us = measure(codec.flatten, payloads)[1]
+    results = {
+        "json": measure(lambda p: json.dumps(p, separators=(",", ":"), ensure_ascii=False), payloads),
+        "json-fast": measure(dumps, payloads),
+        "keyframe": measure(keyframe, pairs),
+        "delta": measure(delta, pairs),
+    }
+
+    print(f"{args.ticks} ticks, orjson {'available' if orjson is not None else 'not installed'}")
+    for name, (size, micros) in results.items():
+        if name in ('keyframe', 'delta'):
+            # Flattening the payload is part of every binary frame's cost
+            micros += flatten_us
+        print(f"{name:>10}: {size:7.1f} bytes/tick, {micros:6.1f} us/tick")
+    print(f"(binary timings include {flatten_us:.1f} us to flatten the payload)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+"""
+Wire formats of the /ws stream.
+
+JSON (the default): every tick is the full payload as a compact UTF-8 text
+frame, encoded with orjson when it is installed.
+
+Binary (negotiated with /ws?encoding=binary): the session first receives one
+JSON text frame with the schema (field names, action names, datetime origin,
+risk method, reason templates), i.e. everything that never changes. Every tick is then one
+little-endian binary frame:
+
+    header   <BBHIB: kind (1 keyframe, 2 delta), flags, field count n,
+             tick index, action index
+    keyframe n float32 values, in schema field order
+    delta    a ceil(n / 8)-byte bitmask of the fields that changed since the
+             previous tick, followed by only those float32 values. The
+             Monte Carlo risk bands change on every tick while the storage
+             is away from its bounds, so a delta is then barely smaller than
+             a keyframe; it saves most once the bands saturate at a bound
+    reason   only in keyframes and when the text changed. With flags &
+             REASON: uint16 byte length and the UTF-8 text. With flags &
+             TEMPLATE: uint8 index into the schema's reason templates,
+             uint16 byte length and the UTF-8 'name=value' arguments,
+             separated by \x1f, that fill its {name} placeholders
+
+A session's first binary frame is a keyframe and later ones are deltas. The
+datetime of tick i is start + (i % period) hours; a frame that covers
+several hours (the hours field) is stamped with the last of them. Values are
+float32, so they round-trip to about 7 significant digits; the risk fields
+are NaN while flags & RISK is clear.
+"""
+import json
+import struct
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from predict import ACTIONS, FEATURES
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+KEYFRAME, DELTA = 1, 2
+REASON, RISK, TEMPLATE = 1, 2, 4
+HEADER = struct.Struct('<BBHIB')
+REASON_LENGTH = struct.Struct('<H')
+DATETIME_FORMAT = '%Y-%m-%d %H:%M'
+
+
+class Reason(str):
+    """
+    Recommendation text rendered from one of a fixed tuple of templates.
+
+    It is an ordinary string to JSON, while the binary format sends only the
+    template index and the arguments.
+    """
+
+    def __new__(cls, templates, index, **args):
+        reason = super().__new__(cls, templates[index].format(**args))
+        reason.templates = templates
+        reason.index = index
+        reason.args = args
+        return reason
+
+
+def dumps(payload):
+    """Compact JSON text of a payload"""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+
+class FrameCodec:
+    """Flattens tick payloads into the fixed float32 layout of the binary format"""
+
+    def __init__(self, start, period, horizon=10, quantiles=(0.05, 0.5, 0.95), risk_method=None,
+                 reason_templates=()):
+        self.start = start
+        self.period = period
+        self.horizon = horizon
+        self.bands = [f"p{round(q * 100):02d}" for q in quantiles]
+        self.risk_method = risk_method
+        self.reason_templates = reason_templates
+        self.fields = (
+            [f'real.{f}' for f in FEATURES]
+            + [f'predict.{f}' for f in FEATURES]
+            + ['hours', 'storage', 'recommendation.amount', 'recommendation.confidence',
+               'recommendation.storage_stats.current', 'recommendation.storage_stats.min_24h',
+               'recommendation.storage_stats.max_24h']
+            + [f'future_storages.{t}' for t in range(horizon)]
+            + ['recommendation.risk.samples', 'recommendation.risk.p_empty',
+               'recommendation.risk.p_full', 'recommendation.risk.elapsed_ms']
+            + [f'recommendation.risk.bands.{band}.{t}' for band in self.bands for t in range(horizon)]
+        )
+        self.risk_fields = 4 + len(self.bands) * horizon
+
+    def schema(self):
+        return {
+            "type": "schema",
+            "version": 2,
+            "fields": self.fields,
+            "actions": list(ACTIONS),
+            "datetime": {"start": self.start, "step_hours": 1, "period": self.period},
+            "risk_method": self.risk_method,
+            "reason_templates": list(self.reason_templates)
+        }
+
+    def flatten(self, payload):
+        """(float32 values, action index, reason, has_risk) of one payload"""
+        recommendation = payload['recommendation']
+        stats = recommendation['storage_stats']
+        risk = recommendation.get('risk')
+        if len(payload['future_storages']) != self.horizon:
+            raise ValueError(f"expected {self.horizon} future storages, got {len(payload['future_storages'])}")
+
+        row = [payload['real'][f] for f in FEATURES]
+        row += [payload['predict'][f] for f in FEATURES]
+        row += [payload.get('hours', 1), payload['storage'], recommendation['amount'],
+                recommendation['confidence'], stats['current'], stats['min_24h'], stats['max_24h']]
+        row += payload['future_storages']
+        if risk is not None:
+            row += [risk['samples'], risk['p_empty'], risk['p_full'], risk['elapsed_ms']]
+            for band in self.bands:
+                row += risk['bands'][band]
+        else:
+            row += [np.nan] * self.risk_fields
+        return (np.array(row, dtype=np.float32), ACTIONS.index(recommendation['action']),
+                recommendation['reason'], risk is not None)
+
+    def encode(self, tick, values, action, reason, has_risk, previous=None, previous_reason=None):
+        """Keyframe, or a delta against the previous tick's values when they are given"""
+        flags = RISK if has_risk else 0
+        send_reason = previous is None or reason != previous_reason
+        if send_reason:
+            templated = isinstance(reason, Reason) and reason.templates is self.reason_templates
+            flags |= TEMPLATE if templated else REASON
+
+        if previous is None:
+            parts = [HEADER.pack(KEYFRAME, flags, len(values), tick, action), values.tobytes()]
+        else:
+            # Bitwise comparison, so NaN -> NaN counts as unchanged
+            changed = values.view(np.uint32) != previous.view(np.uint32)
+            mask = np.packbits(changed, bitorder='little')
+            parts = [HEADER.pack(DELTA, flags, len(values), tick, action), mask.tobytes(),
+                     values[changed].tobytes()]
+        if flags & TEMPLATE:
+            text = '\x1f'.join(f'{name}={value}' for name, value in reason.args.items()).encode()
+            parts += [bytes([reason.index]), REASON_LENGTH.pack(len(text)), text]
+        elif flags & REASON:
+            text = reason.encode()
+            parts += [REASON_LENGTH.pack(len(text)), text]
+        return b''.join(parts)
+
+
+class Frame:
+    """
+    One tick as published to every subscriber of a scenario.
+
+    The payload is flattened once; the JSON text, keyframe and delta are
+    each encoded at most once, on first use, however many sessions send them.
+    """
+
+    def __init__(self, codec, tick, payload, previous=None):
+        self.codec = codec
+        self.tick = tick
+        self.payload = payload
+        self.values, self.action, self.reason, self.has_risk = codec.flatten(payload)
+        self._previous = (previous.values, previous.reason) if previous is not None else None
+        self._text = self._keyframe = self._delta = None
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = dumps(self.payload)
+        return self._text
+
+    @property
+    def keyframe(self):
+        if self._keyframe is None:
+            self._keyframe = self.codec.encode(self.tick, self.values, self.action, self.reason, self.has_risk)
+        return self._keyframe
+
+    @property
+    def delta(self):
+        if self._previous is None:
+            return self.keyframe
+        if self._delta is None:
+            values, reason = self._previous
+            self._delta = self.codec.encode(self.tick, self.values, self.action, self.reason, self.has_risk,
+                                            values, reason)
+        return self._delta
+
+
+class FrameDecoder:
+    """Rebuilds payload dicts from a schema and a session's binary frames, the reference for clients"""
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.fields = schema["fields"]
+        self.start = datetime.strptime(schema["datetime"]["start"], DATETIME_FORMAT)
+        self.values = None
+        self.reason = None
+
+    def decode(self, frame):
+        kind, flags, count, tick, action = HEADER.unpack_from(frame)
+        offset = HEADER.size
+        if kind == KEYFRAME:
+            self.values = np.frombuffer(frame, dtype='<f4', count=count, offset=offset).copy()
+            offset += 4 * count
+        else:
+            mask_bytes = (count + 7) // 8
+            mask = np.unpackbits(np.frombuffer(frame, dtype=np.uint8, count=mask_bytes, offset=offset),
+                                 count=count, bitorder='little').astype(bool)
+            offset += mask_bytes
+            changed = int(mask.sum())
+            self.values[mask] = np.frombuffer(frame, dtype='<f4', count=changed, offset=offset)
+            offset += 4 * changed
+        if flags & (REASON | TEMPLATE):
+            template = None
+            if flags & TEMPLATE:
+                template = self.schema["reason_templates"][frame[offset]]
+                offset += 1
+            (length,) = REASON_LENGTH.unpack_from(frame, offset)
+            offset += REASON_LENGTH.size
+            text = frame[offset:offset + length].decode()
+            if template is not None:
+                args = dict(arg.split('=', 1) for arg in text.split('\x1f')) if text else {}
+                text = template.format(**args)
+            self.reason = text
+
+        payload = {}
+        for name, value in zip(self.fields, self.values.tolist()):
+            if name.startswith('recommendation.risk.') and not flags & RISK:
+                continue
+            *path, leaf = name.split('.')
+            node = payload
+            for key in path:
+                node = node.setdefault(key, {})
+            node[leaf] = value
+
+        when = self.start + timedelta(hours=tick % self.schema["datetime"]["period"])
+        payload["datetime"] = when.strftime(DATETIME_FORMAT)
+        payload["hours"] = int(payload["hours"])
+        recommendation = payload["recommendation"]
+        recommendation["action"] = self.schema["actions"][action]
+        recommendation["reason"] = self.reason
+        if flags & RISK:
+            risk = recommendation["risk"]
+            risk["method"] = self.schema["risk_method"]
+            risk["samples"] = int(risk["samples"])
+            risk["bands"] = {band: [steps[str(t)] for t in range(len(steps))]
+                             for band, steps in risk["bands"].items()}
+        else:
+            recommendation["risk"] = None
+        payload["future_storages"] = [payload["future_storages"][str(t)]
+                                      for t in range(len(payload["future_storages"]))]
+        return payload
@@ -0,0 +1,78 @@
+"""
+Accuracy and latency of a direct multi-horizon checkpoint against the
+recursive rollout of the one-step model.
+
+Both models forecast the same held-out windows (the last 20% of the rows,
+the split the training scripts validate on). The report gives the mean
+absolute error per forecast hour, in scaled units, and the median latency of
+a single-window forecast and of one batched forecast over every window.
+
+Usage:
+    python horizon_benchmark.py --direct model/house_consumption_model_direct.pth --horizon 10
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+import torch
+
+from backtest import load_dataset
+from predict import load_model, rollout
+
+
+def heldout_windows(data, seq_length=24, horizon=10, train_split=0.8):
+    """(windows, targets) for every full window/target pair in the validation split"""
+    heldout = data[int(len(data) * train_split):]
+    starts = np.arange(len(heldout) - seq_length - horizon + 1)
+    windows = heldout[starts[:, None] + np.arange(seq_length)]
+    targets = heldout[starts[:, None] + seq_length + np.arange(horizon)]
+    return windows, targets
+
+
+def median_ms(fn, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def benchmark(model, device, windows, targets, runs=50):
+    horizon = targets.shape[1]
+    forecasts = rollout(model, windows, device, hours=horizon).cpu().numpy()
+    mae = np.abs(forecasts - targets).mean(axis=(0, 2))
+    return {
+        "mae_per_hour": mae.astype(np.float64).round(4).tolist(),
+        "mae": float(mae.mean()),
+        "single_ms": median_ms(lambda: rollout(model, windows[0], device, hours=horizon), runs),
+        "batch_ms": median_ms(lambda: rollout(model, windows, device, hours=horizon), max(1, runs // 10))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare a direct multi-horizon model with the recursive rollout')
+    parser.add_argument('--data', default='data/processed_data_0101_to_1231.csv')
+    parser.add_argument('--recursive', default='model/house_consumption_model_3d.pth')
+    parser.add_argument('--direct', required=True, help='checkpoint trained with train_3d_model.py --horizon')
+    parser.add_argument('--horizon', type=int, default=10)
+    parser.add_argument('--runs', type=int, default=50, help='timed repetitions of the single-window forecast')
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    data = load_dataset(args.data)
+    windows, targets = heldout_windows(data, horizon=args.horizon)
+    print(f'{len(windows)} held-out windows, horizon {args.horizon}')
+
+    for name, path in (('recursive', args.recursive), ('direct', args.direct)):
+        model, device = load_model(path)
+        report = benchmark(model, device, windows, targets, args.runs)
+        print(f"{name:>9}: MAE {report['mae']:.4f}, "
+              f"single window {report['single_ms']:.2f} ms, "
+              f"all windows {report['batch_ms']:.1f} ms")
+        print(f"{'':>9}  MAE per hour: {report['mae_per_hour']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import asyncio
+from collections import Counter
+
+import numpy as np
+
+from predict import rollout
+
+
+class InferenceBatcher:
+    """
+    Shared inference scheduler for all WebSocket sessions.
+
+    Sessions submit their (seq_length, 3) history windows and await a future.
+    Requests are collected until max_batch_size is reached or max_wait_ms has
+    passed since the first one arrived, then the whole batch goes through one
+    batched LSTMPredictor rollout and every session gets its own slice back.
+
+    The forward pass runs on `executor` so it never blocks the event loop; at
+    most `max_in_flight` batches are dispatched to it at the same time.
+    """
+
+    def __init__(self, model, device, max_batch_size=64, max_wait_ms=5,
+                 executor=None, max_in_flight=1):
+        self.model = model
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.executor = executor
+        self.max_in_flight = max_in_flight
+
+        self.queue = asyncio.Queue()
+        self.batch_sizes = Counter()
+        self.requests_served = 0
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, window, hours=10):
+        """Queue one history window and wait for its (hours, 3) forecast"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((np.asarray(window, dtype=np.float32), hours, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        slots = asyncio.Semaphore(self.max_in_flight)
+        while True:
+            batch = await self._collect()
+            await slots.acquire()
+            task = asyncio.create_task(self._run_batch(batch))
+            task.add_done_callback(lambda _: slots.release())
+
+    def _forward(self, windows, hours):
+        return rollout(self.model, windows, self.device, hours=hours).cpu().numpy()
+
+    async def _run_batch(self, batch):
+        windows = np.stack([window for window, _, _ in batch])
+        hours = max(h for _, h, _ in batch)
+
+        try:
+            forecasts = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self._forward, windows, hours)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batch_sizes[len(batch)] += 1
+        self.requests_served += len(batch)
+        for i, (_, h, future) in enumerate(batch):
+            if not future.done():  # session may have disconnected meanwhile
+                future.set_result(forecasts[i, :h])
+
+    def metrics(self):
+        batches = sum(self.batch_sizes.values())
+        return {
+            "queue_depth": self.queue.qsize(),
+            "batches": batches,
+            "requests": self.requests_served,
+            "mean_batch_size": self.requests_served / batches if batches else 0,
+            "batch_size_histogram": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+        }
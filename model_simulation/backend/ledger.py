@@ -0,0 +1,300 @@
+"""
+Durable energy ledger behind /purchase and the simulations' storage updates.
+
+Every balance change is a record in an append-only SQLite transaction log
+(WAL mode). Operations are applied to the in-memory balances under one lock,
+so a purchase's check and withdrawal are a single atomic step, and the record
+is queued for a background writer thread. The writer commits whatever has
+queued up while the previous commit was syncing as one transaction (group
+commit), so thousands of purchases share a handful of fsyncs. Callers that
+must not acknowledge before the record is on disk await Ledger.durable(seq).
+
+Every snapshot_every records the writer also stores a snapshot of all
+balances in the same transaction. Recovery loads the latest snapshot and
+replays only the records after it, applying the amounts in log order, so the
+recovered balances are bit-identical to the ones before the restart.
+"""
+import asyncio
+import math
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    seq INTEGER PRIMARY KEY,
+    account TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    amount REAL NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    seq INTEGER NOT NULL,
+    account TEXT NOT NULL,
+    balance REAL NOT NULL,
+    PRIMARY KEY (seq, account)
+);
+"""
+
+
+def _check_finite(amount):
+    # A NaN or infinite record would poison the balance and fail the whole commit group
+    if not math.isfinite(amount):
+        raise ValueError(f'amount must be finite, got {amount}')
+
+
+def _resolve(futures):
+    for future in futures:
+        if not future.done():
+            future.set_result(None)
+
+
+def _fail(futures, error):
+    for future in futures:
+        if not future.done():
+            future.set_exception(error)
+
+
+class Ledger:
+    """
+    Account balances backed by a group-committed SQLite transaction log.
+
+    purchase() and settle() return the sequence number of the record they
+    appended; durable(seq) resolves once it has been committed. A failed
+    commit is queued again and retried with backoff, so durable() only
+    raises for records still failing after close_retries attempts when the
+    ledger is closed. Amounts that are not finite (or, for purchases, not
+    positive) raise ValueError before anything is applied or logged.
+    """
+
+    def __init__(self, path, snapshot_every=10000, synchronous='FULL', close_retries=3):
+        self.path = path
+        self.snapshot_every = snapshot_every
+        self.close_retries = close_retries
+        # A second writer would reuse our sequence numbers, so the database is ours
+        # alone: the exclusive lock is taken now and held until close()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=0)
+        try:
+            self._db.execute('PRAGMA locking_mode=EXCLUSIVE')
+            self._db.execute('BEGIN EXCLUSIVE')
+            self._db.execute('COMMIT')
+        except sqlite3.OperationalError as e:
+            self._db.close()
+            raise RuntimeError(f'Ledger {path} is in use by another process ({e})') from e
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(f'PRAGMA synchronous={synchronous}')
+        self._db.executescript(SCHEMA)
+
+        start = time.perf_counter()
+        self.balances, self.snapshot_seq, self.replayed = self._recover()
+        self.recovery_seconds = time.perf_counter() - start
+        self.seq = self._db.execute('SELECT MAX(seq) FROM transactions').fetchone()[0] or 0
+        self.committed_seq = self.seq
+        # Balances as of committed_seq, the source of snapshots
+        self._durable = dict(self.balances)
+
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._pending = []
+        self._waiters = []
+        self._closing = False
+        self.commits = 0
+        self.commit_failures = 0
+        self.records_committed = 0
+        self.commit_seconds = 0.0
+        self._writer = threading.Thread(target=self._run, name='ledger-writer', daemon=True)
+        self._writer.start()
+
+    def _recover(self):
+        # Latest snapshot plus the records appended after it
+        snapshot = self._db.execute('SELECT MAX(seq) FROM snapshots').fetchone()[0] or 0
+        balances = dict(self._db.execute('SELECT account, balance FROM snapshots WHERE seq = ?', (snapshot,)))
+        replayed = 0
+        for account, amount in self._db.execute(
+                'SELECT account, amount FROM transactions WHERE seq > ? ORDER BY seq', (snapshot,)):
+            balances[account] = balances.get(account, 0.0) + amount
+            replayed += 1
+        return balances, snapshot, replayed
+
+    def _append(self, account, kind, amount):
+        # Caller holds the lock
+        self.seq += 1
+        self._pending.append((self.seq, account, kind, amount, time.time()))
+        self._changed.notify_all()
+        return self.seq
+
+    def open(self, account, initial=0.0):
+        """Create an account with an opening balance, unless it exists (e.g. was recovered)"""
+        _check_finite(initial)
+        with self._lock:
+            if account in self.balances:
+                return self.seq
+            self.balances[account] = 0.0 + initial
+            return self._append(account, 'open', initial)
+
+    def balance(self, account):
+        return self.balances[account]
+
+    def purchase(self, account, amount):
+        """
+        Withdraw amount if the balance covers it, atomically.
+
+        Returns (success, balance afterwards, seq). On failure nothing is
+        logged and seq covers the records the decision was based on.
+        """
+        _check_finite(amount)
+        if amount <= 0:
+            raise ValueError(f'purchase amount must be positive, got {amount}')
+        with self._lock:
+            balance = self.balances[account]
+            if balance < amount:
+                return False, balance, self.seq
+            balance = self.balances[account] = balance - amount
+            return True, balance, self._append(account, 'purchase', -amount)
+
+    def settle(self, account, amount, kind='settle'):
+        """Add amount (negative to withdraw) unconditionally; returns (balance, seq)"""
+        _check_finite(amount)
+        with self._lock:
+            balance = self.balances[account] = self.balances[account] + amount
+            return balance, self._append(account, kind, amount)
+
+    def account(self, name, initial=0.0):
+        return LedgerAccount(self, name, initial)
+
+    async def durable(self, seq):
+        """Wait until every record up to seq has been committed"""
+        if seq <= self.committed_seq:
+            return
+        future = asyncio.get_running_loop().create_future()
+        with self._lock:
+            if seq <= self.committed_seq:
+                return
+            self._waiters.append((seq, future))
+        await future
+
+    def flush(self, timeout=None):
+        """Block until everything appended so far has been committed"""
+        with self._lock:
+            seq = self.seq
+            return self._changed.wait_for(lambda: self.committed_seq >= seq or self._closing, timeout)
+
+    def close(self):
+        """Commit the remaining records, stop the writer and close the database"""
+        with self._lock:
+            self._closing = True
+            self._changed.notify_all()
+        self._writer.join()
+        self._db.close()
+
+    def _run(self):
+        failures = 0
+        while True:
+            with self._lock:
+                self._changed.wait_for(lambda: self._pending or self._closing)
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, []
+            last = batch[-1][0]
+
+            start = time.perf_counter()
+            try:
+                durable = self._commit(batch, last)
+            except sqlite3.Error as e:
+                failures += 1
+                self.commit_failures += 1
+                print(f'Ledger commit of records {batch[0][0]}-{last} failed (attempt {failures}): {e}')
+                with self._lock:
+                    # Nothing of the batch is on disk: queue it again ahead of newer records
+                    self._pending = batch + self._pending
+                    if not self._closing or failures < self.close_retries:
+                        # Back off, waking early only to shut down
+                        self._changed.wait_for(lambda: self._closing, min(0.01 * 2 ** failures, 1.0))
+                        continue
+                    # Shutting down and the database keeps failing: the records are lost
+                    done, self._waiters, self._pending = self._waiters, [], []
+                    self._changed.notify_all()
+                self._wake(done, _fail, e)
+                return
+            failures = 0
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                self._durable = durable
+                self.committed_seq = last
+                self.commits += 1
+                self.records_committed += len(batch)
+                self.commit_seconds += elapsed
+                done = [w for w in self._waiters if w[0] <= last]
+                self._waiters = [w for w in self._waiters if w[0] > last]
+                self._changed.notify_all()
+            self._wake(done, _resolve)
+
+    def _wake(self, waiters, callback, *args):
+        # Wake each event loop once for all of its waiters
+        by_loop = defaultdict(list)
+        for _, future in waiters:
+            by_loop[future.get_loop()].append(future)
+        for loop, futures in by_loop.items():
+            loop.call_soon_threadsafe(callback, futures, *args)
+
+    def _commit(self, batch, last):
+        durable = dict(self._durable)
+        for _, account, _, amount, _ in batch:
+            durable[account] = durable.get(account, 0.0) + amount
+
+        self._db.execute('BEGIN')
+        try:
+            self._db.executemany('INSERT INTO transactions VALUES (?, ?, ?, ?, ?)', batch)
+            snapshot = last - self.snapshot_seq >= self.snapshot_every
+            if snapshot:
+                self._db.execute('DELETE FROM snapshots')
+                self._db.executemany('INSERT INTO snapshots VALUES (?, ?, ?)',
+                                     [(last, account, balance) for account, balance in durable.items()])
+            self._db.execute('COMMIT')
+        except sqlite3.Error:
+            self._db.execute('ROLLBACK')
+            raise
+        if snapshot:
+            self.snapshot_seq = last
+        return durable
+
+    def metrics(self):
+        return {
+            "accounts": len(self.balances),
+            "seq": self.seq,
+            "committed_seq": self.committed_seq,
+            "pending": self.seq - self.committed_seq,
+            "commits": self.commits,
+            "commit_failures": self.commit_failures,
+            "mean_records_per_commit": self.records_committed / self.commits if self.commits else 0,
+            "mean_commit_ms": self.commit_seconds / self.commits * 1000 if self.commits else 0,
+            "snapshot_seq": self.snapshot_seq,
+            "recovered_records": self.replayed,
+            "recovery_ms": self.recovery_seconds * 1000
+        }
+
+
+class LedgerAccount:
+    """EnergyStorage interface over one ledger account, for SimulationEngine and /purchase"""
+
+    def __init__(self, ledger, name, initial_storage=0.0):
+        self.ledger = ledger
+        self.name = name
+        ledger.open(name, initial_storage)
+
+    @property
+    def storage(self):
+        return self.ledger.balance(self.name)
+
+    def update_storage(self, wind_generation, solar_generation, consumption):
+        total_generation = wind_generation + solar_generation
+        self.ledger.settle(self.name, total_generation - consumption)
+
+    def purchase(self, amount):
+        """(success, balance, seq), see Ledger.purchase"""
+        return self.ledger.purchase(self.name, amount)
+
+    def purchase_energy(self, amount):
+        return self.purchase(amount)[0]
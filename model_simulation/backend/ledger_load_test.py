@@ -0,0 +1,147 @@
+"""
+Load test of the energy ledger: sustained purchases per second with durable acknowledgements.
+
+By default the ledger is driven in-process on a scratch database: --clients
+concurrent coroutines each purchase and await Ledger.durable() in a loop for
+--seconds, while a worker thread settles storage updates the way the
+simulation engines do. Afterwards the database is reopened and the recovered
+balances must equal the in-memory ones exactly.
+
+With --url the same purchase loop runs against a server's /purchase endpoint
+over HTTP instead, one keep-alive connection per client. The server's
+default account only holds a few kWh and amounts must be positive, so use a
+tiny --amount there to keep purchases succeeding and going through the log.
+
+Usage:
+    python ledger_load_test.py --clients 64 --seconds 5
+    python ledger_load_test.py --url http://127.0.0.1:8000 --clients 32 --amount 1e-6
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+from ledger import Ledger
+
+
+async def purchase_loop(purchase, deadline, latencies):
+    successes = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        successes += await purchase()
+        latencies.append(time.perf_counter() - start)
+    return successes
+
+
+def settle_loop(ledger, account, rate, stop):
+    # Stands in for the engines' hourly storage updates from another thread
+    interval = 1 / rate
+    while not stop.is_set():
+        ledger.settle(account, 0.25)
+        time.sleep(interval)
+
+
+async def run_local(args):
+    path = os.path.join(tempfile.mkdtemp(prefix='ledger-'), 'ledger.db')
+    ledger = Ledger(path, snapshot_every=args.snapshot_every, synchronous=args.synchronous)
+    ledger.open('default', args.initial)
+
+    async def purchase():
+        success, _, seq = ledger.purchase('default', args.amount)
+        await ledger.durable(seq)
+        return success
+
+    stop = threading.Event()
+    settler = threading.Thread(target=settle_loop, args=(ledger, 'default', args.settle_rate, stop))
+    settler.start()
+    latencies = []
+    start = time.perf_counter()
+    deadline = start + args.seconds
+    successes = sum(await asyncio.gather(*(purchase_loop(purchase, deadline, latencies)
+                                            for _ in range(args.clients))))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    settler.join()
+
+    metrics = ledger.metrics()
+    balance = ledger.balance('default')
+    ledger.close()
+
+    start = time.perf_counter()
+    recovered = Ledger(path)
+    recovery_ms = (time.perf_counter() - start) * 1000
+    report(latencies, successes, elapsed)
+    print(f"commits {metrics['commits']}, {metrics['mean_records_per_commit']:.1f} records/commit, "
+          f"{metrics['mean_commit_ms']:.2f} ms/commit")
+    print(f"recovery: {recovered.replayed} records after snapshot {recovered.snapshot_seq} in {recovery_ms:.1f} ms, "
+          f"balance {'matches' if recovered.balance('default') == balance else 'DIFFERS'} "
+          f"({balance:.2f} kWh, {'no overdraft' if balance >= 0 else 'OVERDRAWN'})")
+    recovered.close()
+
+
+async def http_client(url):
+    """purchase() coroutine over one keep-alive HTTP/1.1 connection to url's /purchase"""
+    host, port = urlsplit(url).hostname, urlsplit(url).port or 80
+    reader, writer = await asyncio.open_connection(host, port)
+
+    async def request(method, path, body=b''):
+        writer.write(f'{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n'
+                     f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+        head = (await reader.readuntil(b'\r\n\r\n')).decode().lower()
+        length = int(head.split('content-length:')[1].split('\r\n')[0])
+        return json.loads(await reader.readexactly(length))
+
+    return request
+
+
+async def run_http(args):
+    # A minimal stdlib client, so the load generator is not the bottleneck
+    clients = [await http_client(args.url) for _ in range(args.clients)]
+    body = json.dumps({"type": "buy", "amount": args.amount}).encode()
+    latencies = []
+    start = time.perf_counter()
+    deadline = start + args.seconds
+
+    def purchaser(request):
+        async def purchase():
+            return (await request('POST', '/purchase', body))["success"]
+        return purchase
+
+    successes = sum(await asyncio.gather(*(purchase_loop(purchaser(request), deadline, latencies)
+                                            for request in clients)))
+    report(latencies, successes, time.perf_counter() - start)
+    ledger = (await clients[0]('GET', '/metrics'))["ledger"]
+    print(f"server: commits {ledger['commits']}, {ledger['mean_records_per_commit']:.1f} records/commit, "
+          f"{ledger['mean_commit_ms']:.2f} ms/commit")
+
+
+def report(latencies, successes, elapsed):
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99)] if latencies else float('nan')
+    print(f"{len(latencies)} purchases ({successes} succeeded) in {elapsed:.2f}s: "
+          f"{len(latencies) / elapsed:.0f} purchases/s, latency p50 {statistics.median(latencies) * 1000:.2f} ms, "
+          f"p99 {p99 * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Purchases per second the ledger sustains with durable commits')
+    parser.add_argument('--url', help='load a running server instead of an in-process ledger')
+    parser.add_argument('--clients', type=int, default=64, help='concurrent purchasers')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--amount', type=float, default=0.01)
+    parser.add_argument('--initial', type=float, default=1e6, help='opening balance (in-process only)')
+    parser.add_argument('--settle-rate', type=float, default=100, help='storage updates per second (in-process only)')
+    parser.add_argument('--snapshot-every', type=int, default=10000)
+    parser.add_argument('--synchronous', default='FULL', help='SQLite synchronous pragma')
+    args = parser.parse_args()
+
+    asyncio.run(run_http(args) if args.url else run_local(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,219 @@
+import time
+_import_start = time.perf_counter()
+
 import asyncio
+from contextlib import asynccontextmanager
+import numpy as np
 import pandas as pd
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from data_handler import EnergyStorage
-from predict import load_model, predict_next_hour, calculate_trade_action, predict_multiple_hours
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse
+from data_handler import load_replay_data
+from ledger import Ledger
+from predict import load_model, rollout, FEATURES
+from inference_server import InferenceBatcher
+from simulation import SimulationEngine
+from frames import dumps
+from policy import REASON_TEMPLATES, calculate_trade_action
+from forecast_cache import ForecastCache
+from scenarios import ScenarioEngine
+from online import OnlineTrainer
+from forecasting import FeatureScaler, LSTMPredictor
+from pydantic import BaseModel, Field, field_validator
+from typing import Optional
 import os
+import torch
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI()
+# Inference and trade evaluation run in a bounded thread pool so they never
+# block the event loop. Torch intra-op threads are split between the workers
+# so the pool does not oversubscribe the cores.
+inference_workers = int(os.getenv('INFERENCE_WORKERS', 2))
+torch.set_num_threads(int(os.getenv('TORCH_NUM_THREADS', max(1, (os.cpu_count() or 1) // inference_workers))))
+executor = ThreadPoolExecutor(max_workers=inference_workers, thread_name_prefix='inference')
+
+# Initialize storage
+initial_storage = 5  # Initial storage per household 5 kWh
+battery_capacity = 30  # Battery capacity 30 kWh
+
+# Storage balances live in a durable ledger, opened by the lifespan hook;
+# energy_storage is the default scenario's account
+ledger = energy_storage = None
+
+# Scenarios clients may open. Each one is an engine and a durable ledger account,
+# so the set comes from configuration rather than from whatever /ws is asked for
+scenarios = [name.strip() for name in os.getenv('SIM_SCENARIOS', 'default').split(',') if name.strip()]
+
+# Replay speed in simulated hours per wall-clock second; /ws?speed= picks one of
+# SIM_SPEEDS per session. Every speed is its own timeline and account, so only a
+# few are allowed
+default_speed = float(os.getenv('SIM_SPEED', 1))
+speeds = sorted({default_speed} | {float(speed) for speed in os.getenv('SIM_SPEEDS', '1,10,100,1000').split(',')})
+
+# The model and everything built on it are created by the lifespan hook below;
+# /ready reports 503 until they are loaded and warmed up, and for good if
+# that failed (startup_error). ready is set once startup is over either way
+model_path = os.getenv('MODEL_PATH', 'model/house_consumption_model_3d.pth')
+model = device = batcher = forecast_cache = risk_engine = online_trainer = None
+data_array = datetime_index = None
+ready = asyncio.Event()
+startup_error = None
+startup_timings = {}
+
+def load_data():
+    """Replay data as one float32 array, memory-mapped from its .npy cache after the first start"""
+    global data_array, datetime_index
+    data_array = load_replay_data('data/processed_data_0101_to_1231.csv', FEATURES,
+                                  cache=os.getenv('DATA_CACHE', '1') == '1')
+    datetime_index = pd.date_range('2025-01-01', periods=len(data_array), freq='h')
+
+def load_inference():
+    """Load the model, build the batcher, cache, risk engine and online trainer, then warm up torch"""
+    global model, device, batcher, forecast_cache, risk_engine, online_trainer
+    start = time.perf_counter()
+    # MODEL_PATH may also name a TorchScript artifact from export_model.py (.ts / .int8.ts);
+    # MODEL_QUANTIZE=1 int8-quantizes an eager checkpoint at load time
+    quantized = os.getenv('MODEL_QUANTIZE', '0') == '1'
+    model, device = load_model(model_path, quantized=quantized)
+    startup_timings['model_load_s'] = time.perf_counter() - start
+
+    # Shared micro-batching scheduler for all /ws sessions
+    batcher = InferenceBatcher(
+        model, device,
+        max_batch_size=int(os.getenv('INFERENCE_MAX_BATCH_SIZE', 64)),
+        max_wait_ms=float(os.getenv('INFERENCE_MAX_WAIT_MS', 5)),
+        executor=executor,
+        max_in_flight=inference_workers
+    )
+
+    # Forecasts of the replayed rows only depend on the checkpoint, so they are
+    # computed once and served as lookups afterwards. Online learning changes
+    # the weights while serving, so it always forecasts through the batcher.
+    online = os.getenv('ONLINE_LEARNING', '0') == '1'
+    cache_mode = 'off' if online else os.getenv('FORECAST_CACHE', 'precompute')
+    forecast_cache = None if cache_mode == 'off' else ForecastCache(
+        model_path, data_array,
+        horizon=10,
+        mode=cache_mode,
+        max_mb=float(os.getenv('FORECAST_CACHE_MAX_MB', 64)),
+        persist=os.getenv('FORECAST_CACHE_PERSIST', '1') == '1',
+        variant='int8' if quantized else None
+    )
+
+    # Monte Carlo storage-risk estimates attached to every recommendation
+    risk_method = os.getenv('RISK_METHOD', 'bootstrap')
+    risk_engine = None if risk_method == 'off' else ScenarioEngine(
+        method=risk_method,
+        samples=int(os.getenv('RISK_SAMPLES', 2000)),
+        budget_ms=float(os.getenv('RISK_BUDGET_MS', 20)),
+        model=model,
+        device=device
+    )
+
+    # Fine-tunes a copy of the model on the default scenario's rows in a
+    # background process and swaps the weights in, see online.py
+    if online and (quantized or not isinstance(model, LSTMPredictor)):
+        print('ONLINE_LEARNING needs an fp32 eager checkpoint, not a TorchScript or quantized model; disabled')
+    elif online:
+        online_trainer = OnlineTrainer(
+            model, swap_model,
+            scaler=FeatureScaler().fit(data_array),
+            buffer_size=int(os.getenv('ONLINE_BUFFER_ROWS', 2048)),
+            update_every=int(os.getenv('ONLINE_UPDATE_EVERY', 64)),
+            steps=int(os.getenv('ONLINE_STEPS', 8)),
+            batch_size=int(os.getenv('ONLINE_BATCH_SIZE', 32)),
+            lr=float(os.getenv('ONLINE_LR', 1e-4)),
+            checkpoint_path=os.getenv('ONLINE_CHECKPOINT') or None,
+            features=FEATURES
+        )
+
+    # Pay torch's lazy initialization (kernel selection, allocator warmup) for
+    # a single session and a full micro-batch before the first real request
+    start = time.perf_counter()
+    window = data_array[:24]
+    for batch_size in (1, batcher.max_batch_size):
+        for _ in range(int(os.getenv('WARMUP_ITERATIONS', 2))):
+            rollout(model, np.broadcast_to(window, (batch_size,) + window.shape).copy(), device)
+    startup_timings['warmup_s'] = time.perf_counter() - start
+
+def swap_model(new_model):
+    """Serve new weights; batches already running finish on the old model"""
+    global model
+    model = new_model
+    batcher.model = new_model
+    if risk_engine is not None:
+        risk_engine.set_model(new_model)
+
+def prepare_forecasts():
+    start = time.perf_counter()
+    table = None
+    if forecast_cache is not None and forecast_cache.mode == 'precompute':
+        forecast_cache.precompute(model, device)
+        table = forecast_cache.table
+    if risk_engine is not None and risk_engine.method == 'bootstrap':
+        if table is None:
+            scratch = ForecastCache(model_path, data_array, persist=False)
+            scratch.precompute(model, device)
+            table = scratch.table
+        risk_engine.fit_residuals(data_array, table)
+    startup_timings['forecasts_s'] = time.perf_counter() - start
+    print(f"Forecast table ready in {startup_timings['forecasts_s']:.2f}s")
+
+def open_ledger():
+    """Recover the storage balances from the last snapshot and the log records after it"""
+    global ledger, energy_storage
+    ledger = Ledger(os.getenv('LEDGER_PATH', 'data/ledger.db'),
+                    snapshot_every=int(os.getenv('LEDGER_SNAPSHOT_EVERY', 10000)),
+                    synchronous=os.getenv('LEDGER_SYNCHRONOUS', 'FULL'))
+    energy_storage = ledger.account('default', initial_storage)
+    startup_timings['ledger_recovery_s'] = ledger.recovery_seconds
+
+async def startup():
+    global startup_error
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(executor, load_inference)
+        batcher.start()
+    except Exception as e:
+        # e.g. a bad MODEL_PATH or a checkpoint for other features; waiters are released and answer 503
+        startup_error = f'{type(e).__name__}: {e}'
+        print(f'Startup failed: {startup_error}')
+        ready.set()
+        return
+    ready.set()
+    startup_timings['ready_s'] = time.perf_counter() - _import_start
+    print('Startup: ' + ', '.join(f'{name} {seconds:.2f}s' for name, seconds in startup_timings.items()))
+    # Fill in the background; ticks fall back to the batcher until ready
+    try:
+        await loop.run_in_executor(executor, prepare_forecasts)
+    except Exception as e:
+        print(f'Forecast table failed, forecasting through the batcher: {type(e).__name__}: {e}')
+
+@asynccontextmanager
+async def lifespan(app):
+    startup_timings['import_s'] = time.perf_counter() - _import_start
+    start = time.perf_counter()
+    load_data()
+    startup_timings['data_load_s'] = time.perf_counter() - start
+    open_ledger()
+    # The server accepts connections (and answers /ready) while the model loads
+    startup_task = asyncio.create_task(startup())
+    yield
+    startup_task.cancel()
+    if batcher is not None:
+        await batcher.stop()
+    if online_trainer is not None:
+        online_trainer.close()
+    executor.shutdown(wait=False)
+    ledger.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS middleware configuration
 app.add_middleware(
@@ -22,138 +224,134 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize storage
-initial_storage = 5  # Initial storage per household 5 kWh
-battery_capacity = 30  # Battery capacity 30 kWh
+@app.exception_handler(RequestValidationError)
+async def validation_error(request, exc):
+    # The default 422 body echoes the input, which JSON cannot encode when it is NaN or inf
+    errors = [{k: v for k, v in error.items() if k != 'input'} for error in exc.errors()]
+    return JSONResponse({"detail": jsonable_encoder(errors)}, status_code=422)
 
-energy_storage = EnergyStorage(initial_storage=initial_storage)
+class PurchaseRequest(BaseModel):
+    type: str
+    # Validated before anything reaches the ledger
+    amount: float = Field(gt=0, allow_inf_nan=False)
+    scenario: str = 'default'
+    speed: Optional[float] = None
 
-data_df = pd.read_csv('data/processed_data_0101_to_1231.csv', index_col=0)
-data_records = data_df.to_dict(orient='records')
+    @field_validator('speed')
+    @classmethod
+    def allowed_speed(cls, speed):
+        # The speeds /ws accepts; anything else is a 422
+        if speed is not None and speed not in speeds:
+            raise ValueError(f'speed must be one of {", ".join(f"{s:g}" for s in speeds)}')
+        return speed
 
-model, device = load_model('model/house_consumption_model_3d.pth')
+# One simulation engine per configured scenario and speed, shared by every /ws
+# subscriber of it. Runs at other than the default speed are separate timelines
+# named '<scenario>@<speed>x' with their own ledger account. The default scenario
+# at the default speed drives the global energy_storage.
+engines = {}
+accounts = {}
 
-class PurchaseRequest(BaseModel):
-    type: str
-    amount: float
+def engine_name(scenario, speed=None):
+    speed = speed or default_speed
+    return scenario if speed == default_speed else f'{scenario}@{speed:g}x'
+
+def get_account(name):
+    """Ledger account of an engine name, opened on first use"""
+    if name == 'default':
+        return energy_storage
+    if name not in accounts:
+        accounts[name] = ledger.account(name, initial_storage)
+    return accounts[name]
+
+def get_engine(scenario, speed=None):
+    speed = speed or default_speed
+    name = engine_name(scenario, speed)
+    if name not in engines:
+        engines[name] = SimulationEngine(
+            name, data_array, datetime_index, get_account(name), batcher, executor,
+            trade_action=calculate_trade_action,
+            cache=forecast_cache,
+            risk=risk_engine,
+            learner=online_trainer if name == 'default' else None,
+            speed=speed,
+            max_frame_rate=float(os.getenv('SIM_MAX_FRAME_RATE', 20)),
+            queue_size=int(os.getenv('WS_SEND_QUEUE_SIZE', 8)),
+            reason_templates=REASON_TEMPLATES
+        )
+    return engines[name]
 
 @app.post('/purchase')
 async def purchase_energy(request: PurchaseRequest):
-    success = energy_storage.purchase_energy(request.amount)
+    # Only needs the ledger, which is open before the model starts loading
+    if request.scenario not in scenarios:
+        return JSONResponse({"detail": f"Unknown scenario '{request.scenario}'"}, status_code=404)
+    storage = get_account(engine_name(request.scenario, request.speed))
+    # Check and withdrawal are one atomic ledger operation; answer once it is on disk
+    success, balance, seq = storage.purchase(request.amount)
+    await ledger.durable(seq)
     return {
         "success": success, 
-        "storage": energy_storage.storage
+        "storage": balance
+    }
+
+def not_ready():
+    return JSONResponse({"ready": False, "error": startup_error, "startup": startup_timings}, status_code=503)
+
+@app.get('/ready')
+async def readiness():
+    if not ready.is_set() or startup_error is not None:
+        return not_ready()
+    return {"ready": True, "startup": startup_timings}
+
+@app.get('/metrics')
+async def metrics():
+    if not ready.is_set() or startup_error is not None:
+        return not_ready()
+    return {
+        "startup": startup_timings,
+        "inference": batcher.metrics(),
+        "forecast_cache": forecast_cache.metrics() if forecast_cache is not None else None,
+        "ledger": ledger.metrics(),
+        "online": online_trainer.metrics() if online_trainer is not None else None,
+        "scenarios": {name: engine.metrics() for name, engine in engines.items()}
     }
 
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(websocket: WebSocket, scenario: str = 'default', encoding: str = 'json',
+                             speed: Optional[float] = None):
     await websocket.accept()
-    i = 0
-    datetime_index = data_df.index if isinstance(data_df.index[0], pd.Timestamp) else pd.date_range('2025-01-01', periods=len(data_records), freq='h')
-
-    while True:
-        try:
-            current_data = data_records[i % len(data_records)]
-            now_time = datetime_index[i % len(datetime_index)]
-
-            recent_sequence = [list(current_data.values())] * 24
-            predicted_values = predict_next_hour(model, recent_sequence, device).flatten().tolist()
-
-            energy_storage.update_storage(
-                wind_generation=current_data['P_wind'],
-                solar_generation=current_data['P_solar'],
-                consumption=current_data['house_consumption']
-            )
-
-            future_predictions = predict_multiple_hours(model, recent_sequence, device, hours=10)
-            recommendation, future_storages = calculate_trade_action(energy_storage.storage, future_predictions)
-
-            # Calculate storage statistics
-            storage_stats = {
-                "current": energy_storage.storage,
-                "min_24h": min(future_storages),
-                "max_24h": max(future_storages)
-            }
-
-            await websocket.send_json({
-                "datetime": now_time.strftime('%Y-%m-%d %H:%M'),
-                "real": current_data,
-                "predict": {
-                    "P_wind": predicted_values[0],
-                    "P_solar": predicted_values[1],
-                    "house_consumption": predicted_values[2]
-                },
-                "storage": energy_storage.storage,
-                "recommendation": {
-                    **recommendation,
-                    "storage_stats": storage_stats
-                },
-                "future_storages": future_storages[1:]  # drop current
-            })
-
-            await asyncio.sleep(1)  # 1 second = 1 hour
-            i += 1
-        except WebSocketDisconnect:
-            break
-
-def calculate_trade_action(current_storage, future_predictions):
-    """Calculate trading recommendations"""
-    # Calculate maximum and minimum storage for next 24 hours
-    future_storages = [current_storage]
-    
-    # Calculate supply and demand balance
-    total_supply = 0
-    total_demand = 0
-    
-    for pred in future_predictions:
-        if isinstance(pred, dict):
-            # Power generation
-            total_supply += pred.get('P_wind', 0) + pred.get('P_solar', 0)
-            # Power demand
-            total_demand += pred.get('house_consumption', 0)
-            # Calculate storage change
-            storage_change = pred.get('P_wind', 0) + pred.get('P_solar', 0) - pred.get('house_consumption', 0)
-            future_storages.append(max(0, min(30, current_storage + storage_change)))
-    
-    min_future = min(future_storages)
-    max_future = max(future_storages)
-    
-    # Calculate confidence, avoid division by zero
-    total = total_supply + total_demand
-    if total == 0:
-        confidence = 0.3  # Use minimum confidence when supply and demand are both 0
-    else:
-        confidence = min(0.95, max(0.3, abs(total_supply - total_demand) / total))
-    
-    # Determine trading direction based on supply and demand
-    if total_supply > total_demand:
-        # Supply exceeds demand, consider selling
-        if current_storage > 15:  # Storage above 50%
-            amount = min(5, current_storage - 10)  # Sell up to 5kWh, maintain at least 10kWh
-            action = 'sell'
-            reason = f"Total power generation ({total_supply:.1f}kWh) exceeds total demand ({total_demand:.1f}kWh), and current storage ({current_storage:.1f}kWh) is high. Recommend selling {amount:.1f}kWh to balance supply and demand"
-        else:
-            action = 'hold'
-            amount = 0
-            reason = f"Although total power generation ({total_supply:.1f}kWh) exceeds total demand ({total_demand:.1f}kWh), current storage ({current_storage:.1f}kWh) is low. Recommend holding"
-    else:
-        # Demand exceeds supply, consider buying
-        if current_storage < 15:  # Storage below 50%
-            amount = min(5, 30 - current_storage)  # Buy up to 5kWh, don't exceed capacity
-            action = 'buy'
-            reason = f"Total power generation ({total_supply:.1f}kWh) is less than total demand ({total_demand:.1f}kWh), and current storage ({current_storage:.1f}kWh) is low. Recommend buying {amount:.1f}kWh to meet demand"
-        else:
-            action = 'hold'
-            amount = 0
-            reason = f"Although total power generation ({total_supply:.1f}kWh) is less than total demand ({total_demand:.1f}kWh), current storage ({current_storage:.1f}kWh) is sufficient. Recommend holding"
-    
-    # Add additional note for low confidence
-    if confidence < 0.6:
-        reason += f". Due to small supply-demand difference, prediction confidence is low. Recommend cautious operation"
-    
-    return {
-        "action": action,
-        "amount": amount,
-        "confidence": confidence,
-        "reason": reason
-    }, future_storages
+    if speed is not None and speed not in speeds:
+        await websocket.close(code=1008, reason=f'speed must be one of {", ".join(f"{s:g}" for s in speeds)}')
+        return
+    if scenario not in scenarios:
+        await websocket.close(code=1008, reason=f"Unknown scenario '{scenario}'")
+        return
+    await ready.wait()
+    if startup_error is not None:
+        await websocket.close(code=1011, reason='Model failed to load')
+        return
+    engine = get_engine(scenario, speed)
+    subscriber = engine.subscribe()
+    binary = encoding == 'binary'
+
+    try:
+        if binary:
+            # Static fields once per session; ticks follow as a keyframe and then deltas
+            await websocket.send_text(dumps(engine.codec.schema()))
+        first = True
+        while True:
+            frame = await subscriber.get()
+            if frame is None:
+                # Fell too far behind the simulation clock
+                await websocket.close(code=1013, reason='Slow consumer')
+                break
+            if binary:
+                await websocket.send_bytes(frame.keyframe if first else frame.delta)
+                first = False
+            else:
+                await websocket.send_text(frame.text)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        engine.unsubscribe(subscriber)
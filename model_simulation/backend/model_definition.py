@@ -1,18 +0,0 @@
-import torch.nn as nn
-
-class LSTMPredictor(nn.Module):
-    def __init__(self, input_size=3, hidden_size=64, num_layers=2, dropout=0.2):
-        super(LSTMPredictor, self).__init__()
-        self.lstm = nn.LSTM(
-            input_size=input_size,
-            hidden_size=hidden_size,
-            num_layers=num_layers,
-            dropout=dropout,
-            batch_first=True
-        )
-        self.linear = nn.Linear(hidden_size, input_size)
-
-    def forward(self, x):
-        lstm_out, _ = self.lstm(x)
-        predictions = self.linear(lstm_out[:, -1, :])
-        return predictions
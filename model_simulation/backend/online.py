@@ -0,0 +1,217 @@
+"""
+Online fine-tuning of the serving model from the replayed stream.
+
+OnlineTrainer buffers the rows the simulation observes and, every
+update_every rows, hands the buffer to a single background worker process.
+The worker keeps its own copy of the model and takes a few Adam steps on
+windows from the buffer, scaled with a running min/max FeatureScaler that
+widens as new rows arrive (partial_fit) instead of being refit from scratch.
+The scaling is affine per feature, so the worker folds it into the first
+LSTM layer and the linear head before returning the weights: the tuned model
+takes the same raw rows as the served one. The new weights are loaded into
+a fresh model and swapped in by reference, so in-flight batches finish on
+the old weights and serving never waits for training.
+
+Before training on newly arrived rows the worker scores the windows ending
+in them with both the base checkpoint and the current tuned weights
+(prequential evaluation); metrics() reports both errors and how far the
+tuned model's outputs and weights have drifted from the base.
+"""
+import asyncio
+import copy
+import functools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from data_handler import HistoryBuffer
+from forecasting import FeatureScaler, HouseConsumptionDataset, build_model, fold_scaler, save_model, unfold_scaler
+
+
+_worker = {}
+
+
+def _init_worker(config, state_dict, lr, threads):
+    # Training runs at low priority so it never competes with serving for the cores
+    if hasattr(os, 'nice'):
+        os.nice(10)
+    torch.set_num_threads(threads)
+    base = build_model(config)
+    base.load_state_dict(state_dict)
+    base.eval()
+    _worker.update(base=base, served=copy.deepcopy(base), model=copy.deepcopy(base), scaler=None,
+                   optimizer=None, lr=lr,
+                   base_params=torch.cat([p.detach().flatten() for p in base.parameters()]))
+
+
+def _fine_tune(rows, fresh, scaler_state, steps, batch_size, seq_length):
+    """Score the windows ending in the `fresh` newest rows, then take `steps` Adam steps over all of rows"""
+    base, served, model = _worker['base'], _worker['served'], _worker['model']
+    horizon = getattr(model, 'horizon', 1)
+    criterion = nn.MSELoss()
+
+    raw = HouseConsumptionDataset(rows, seq_length, horizon)
+    recent = torch.arange(max(0, len(raw) - fresh), len(raw))
+    windows, targets = raw[recent]
+    with torch.no_grad():
+        base_out, served_out = base(windows), served(windows)
+    stats = {
+        "windows": len(recent),
+        "base_sse": float(((base_out - targets) ** 2).mean(dim=tuple(range(1, targets.dim()))).sum()),
+        "online_sse": float(((served_out - targets) ** 2).mean(dim=tuple(range(1, targets.dim()))).sum()),
+    }
+
+    scaler = FeatureScaler.from_state_dict(scaler_state)
+    if _worker['scaler'] is None or _worker['scaler'].state_dict() != scaler_state:
+        # Re-express the weights in the widened scaler's coordinates; Adam's moments do not carry over
+        if _worker['scaler'] is not None:
+            fold_scaler(model, _worker['scaler'])
+        unfold_scaler(model, scaler)
+        _worker['scaler'] = scaler
+        _worker['optimizer'] = torch.optim.Adam(model.parameters(), lr=_worker['lr'])
+    optimizer = _worker['optimizer']
+
+    scaled = HouseConsumptionDataset(scaler.transform(rows).astype(np.float32), seq_length, horizon)
+    model.train()
+    loss_sum = 0.0
+    for _ in range(steps):
+        batch_x, batch_y = scaled[torch.randint(len(scaled), (batch_size,))]
+        optimizer.zero_grad()
+        loss = criterion(model(batch_x), batch_y)
+        loss.backward()
+        optimizer.step()
+        loss_sum += loss.item()
+    model.eval()
+
+    served = _worker['served'] = fold_scaler(copy.deepcopy(model), scaler)
+    with torch.no_grad():
+        params = torch.cat([p.flatten() for p in served.parameters()])
+        stats["train_loss"] = loss_sum / steps if steps else None
+        stats["weight_drift"] = float((params - _worker['base_params']).norm() / _worker['base_params'].norm())
+        stats["output_drift"] = float((served(windows) - base_out).abs().mean()) if len(recent) else 0.0
+    return {k: v.clone() for k, v in served.state_dict().items()}, stats
+
+
+class OnlineTrainer:
+    """
+    Background fine-tuning of a copy of the serving model on observed rows.
+
+    observe() buffers rows and updates the running scaler; when update_every
+    new rows have arrived and no job is in flight, a fine-tuning job is
+    submitted to the worker process. When it finishes, on_swap(model) is
+    called on the event loop with a new eval-mode model holding the tuned
+    weights. Must be used from a running event loop.
+    """
+
+    def __init__(self, model, on_swap, scaler=None, seq_length=24, buffer_size=2048, update_every=64,
+                 steps=8, batch_size=32, lr=1e-4, threads=1, checkpoint_path=None, features=None):
+        self.config = model.config()
+        self.device = next(model.parameters()).device
+        self.on_swap = on_swap
+        self.scaler = scaler or FeatureScaler()
+        self.seq_length = seq_length
+        self.buffer_size = buffer_size
+        self.update_every = update_every
+        self.steps = steps
+        self.batch_size = batch_size
+        self.checkpoint_path = checkpoint_path
+        self.features = features
+        # Enough rows for at least one training window
+        self.min_rows = seq_length + self.config.get('horizon', 1)
+
+        self.buffer = HistoryBuffer(seq_length=buffer_size, num_features=model.input_size)
+        self.rows_seen = 0
+        self.fresh = 0
+        self.updates = 0
+        self.failures = 0
+        self.windows_scored = 0
+        self.base_sse = 0.0
+        self.online_sse = 0.0
+        self.last = None
+        self.last_update_ms = None
+        self._job = None
+        self._started = None
+
+        state_dict = {k: v.detach().cpu() for k, v in model.state_dict().items()}
+        self.pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_init_worker,
+                                        initargs=(self.config, state_dict, lr, threads))
+
+    def observe(self, rows):
+        """Buffer newly observed (k, features) rows"""
+        rows = np.asarray(rows, dtype=np.float32).reshape(-1, self.buffer.buffer.shape[-1])
+        for row in rows:
+            self.buffer.append(row)
+        self.scaler.partial_fit(rows)
+        self.rows_seen += len(rows)
+        self.fresh += len(rows)
+        if self._job is None and self.fresh >= self.update_every and self.rows_seen >= self.min_rows:
+            self._submit()
+
+    def _submit(self):
+        valid = min(self.rows_seen, self.buffer_size)
+        rows = self.buffer.window()[-valid:].copy()
+        fresh, self.fresh = self.fresh, 0
+        self._started = time.perf_counter()
+        self._job = asyncio.get_running_loop().run_in_executor(
+            self.pool, _fine_tune, rows, fresh, self.scaler.state_dict(), self.steps, self.batch_size,
+            self.seq_length)
+        self._job.add_done_callback(self._swap)
+
+    def _swap(self, job):
+        self._job = None
+        if job.cancelled():
+            return
+        try:
+            state_dict, stats = job.result()
+        except Exception as e:
+            self.failures += 1
+            print(f'Online fine-tuning failed: {e}')
+            return
+
+        model = build_model(self.config)
+        model.load_state_dict(state_dict)
+        model.to(self.device).eval()
+        self.on_swap(model)
+
+        self.updates += 1
+        self.last_update_ms = (time.perf_counter() - self._started) * 1000
+        self.windows_scored += stats["windows"]
+        self.base_sse += stats["base_sse"]
+        self.online_sse += stats["online_sse"]
+        self.last = stats
+        if self.checkpoint_path:
+            # Written off the event loop; evaluate.py can compare it with the base checkpoint
+            asyncio.get_running_loop().run_in_executor(
+                None, functools.partial(save_model, self.checkpoint_path, model, features=self.features,
+                                        seq_length=self.seq_length, online_updates=self.updates,
+                                        online_rows=self.rows_seen))
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def metrics(self):
+        scored = self.windows_scored
+        return {
+            "rows_seen": self.rows_seen,
+            "buffer_rows": min(self.rows_seen, self.buffer_size),
+            "updates": self.updates,
+            "failures": self.failures,
+            "in_flight": self._job is not None,
+            "last_update_ms": self.last_update_ms,
+            "scaler": self.scaler.state_dict() if self.scaler.data_min is not None else None,
+            # Next-step error on rows before they were trained on, base checkpoint vs tuned weights
+            "prequential": {
+                "windows": scored,
+                "base_mse": self.base_sse / scored if scored else None,
+                "online_mse": self.online_sse / scored if scored else None
+            },
+            "train_loss": self.last["train_loss"] if self.last else None,
+            "output_drift": self.last["output_drift"] if self.last else None,
+            "weight_drift": self.last["weight_drift"] if self.last else None
+        }
@@ -0,0 +1,82 @@
+"""
+Trading policy served on /ws, shared with the backtest.
+
+calculate_trade_action turns the current storage and the next hours'
+forecasts into a buy/sell/hold recommendation whose reason is rendered from
+REASON_TEMPLATES.
+"""
+from frames import Reason
+
+# Recommendation texts; the binary /ws format sends a template index and its arguments
+_REASONS = (
+    "Total power generation ({supply}kWh) exceeds total demand ({demand}kWh), and current storage ({storage}kWh) is high. Recommend selling {amount}kWh to balance supply and demand",
+    "Although total power generation ({supply}kWh) exceeds total demand ({demand}kWh), current storage ({storage}kWh) is low. Recommend holding",
+    "Total power generation ({supply}kWh) is less than total demand ({demand}kWh), and current storage ({storage}kWh) is low. Recommend buying {amount}kWh to meet demand",
+    "Although total power generation ({supply}kWh) is less than total demand ({demand}kWh), current storage ({storage}kWh) is sufficient. Recommend holding",
+)
+LOW_CONFIDENCE_NOTE = ". Due to small supply-demand difference, prediction confidence is low. Recommend cautious operation"
+REASON_TEMPLATES = _REASONS + tuple(reason + LOW_CONFIDENCE_NOTE for reason in _REASONS)
+
+def calculate_trade_action(current_storage, future_predictions):
+    """Calculate trading recommendations"""
+    # Calculate maximum and minimum storage for next 24 hours
+    future_storages = [current_storage]
+    
+    # Calculate supply and demand balance
+    total_supply = 0
+    total_demand = 0
+    
+    for pred in future_predictions:
+        if isinstance(pred, dict):
+            # Power generation
+            total_supply += pred.get('P_wind', 0) + pred.get('P_solar', 0)
+            # Power demand
+            total_demand += pred.get('house_consumption', 0)
+            # Calculate storage change
+            storage_change = pred.get('P_wind', 0) + pred.get('P_solar', 0) - pred.get('house_consumption', 0)
+            future_storages.append(max(0, min(30, current_storage + storage_change)))
+    
+    min_future = min(future_storages)
+    max_future = max(future_storages)
+    
+    # Calculate confidence, avoid division by zero
+    total = total_supply + total_demand
+    if total == 0:
+        confidence = 0.3  # Use minimum confidence when supply and demand are both 0
+    else:
+        confidence = min(0.95, max(0.3, abs(total_supply - total_demand) / total))
+    
+    # Determine trading direction based on supply and demand
+    if total_supply > total_demand:
+        # Supply exceeds demand, consider selling
+        if current_storage > 15:  # Storage above 50%
+            amount = min(5, current_storage - 10)  # Sell up to 5kWh, maintain at least 10kWh
+            action = 'sell'
+            template = 0
+        else:
+            action = 'hold'
+            amount = 0
+            template = 1
+    else:
+        # Demand exceeds supply, consider buying
+        if current_storage < 15:  # Storage below 50%
+            amount = min(5, 30 - current_storage)  # Buy up to 5kWh, don't exceed capacity
+            action = 'buy'
+            template = 2
+        else:
+            action = 'hold'
+            amount = 0
+            template = 3
+    
+    # Add additional note for low confidence
+    if confidence < 0.6:
+        template += 4
+    reason = Reason(REASON_TEMPLATES, template, supply=f'{total_supply:.1f}', demand=f'{total_demand:.1f}',
+                    storage=f'{current_storage:.1f}', amount=f'{amount:.1f}')
+    
+    return {
+        "action": action,
+        "amount": amount,
+        "confidence": confidence,
+        "reason": reason
+    }, future_storages
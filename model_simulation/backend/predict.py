@@ -1,16 +1,45 @@
 import torch
-from model_definition import LSTMPredictor
+import torch.nn as nn
+from forecasting import FeatureScaler, checkpoint, fold_scaler, rollout
 
-def load_model(model_path):
+FEATURES = ['P_wind', 'P_solar', 'house_consumption']
+
+def quantize(model):
+    """Dynamically int8-quantized copy of a model's LSTM and Linear layers (CPU only)"""
+    return torch.ao.quantization.quantize_dynamic(model.cpu(), {nn.LSTM, nn.Linear}, dtype=torch.qint8)
+
+def load_model(model_path, quantized=False):
+    """
+    Load a checkpoint for inference.
+
+    The architecture comes from the checkpoint's metadata (or, for a bare
+    state_dict, from its weight shapes), see forecasting.checkpoint. A
+    checkpoint trained on other features than FEATURES is rejected. A
+    checkpoint trained on scaled rows has its scaler folded into the weights
+    (forecasting.fold_scaler), so the model always takes and returns raw rows.
+
+    A .ts path is a TorchScript artifact written by export_model.py and is
+    loaded on the CPU as is. quantized=True int8-quantizes an eager
+    checkpoint at load time, also on the CPU.
+    """
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    input_size = 3  # Explicitly set to 3 dimensions!
-    hidden_size = 64
-    num_layers = 2
 
-    model = LSTMPredictor(input_size=input_size, hidden_size=hidden_size, num_layers=num_layers)
-    model.load_state_dict(torch.load(model_path, map_location=device))
-    model.to(device)
-    model.eval()
+    if model_path.endswith('.ts'):
+        device = torch.device('cpu')
+        model = torch.jit.load(model_path, map_location=device)
+        model.eval()
+        return model, device
+
+    model, metadata = checkpoint.load_model(model_path, map_location=device)
+    features = metadata.get("features")
+    if features is not None and list(features) != FEATURES:
+        raise ValueError(f'{model_path} was trained on {features}, expected {FEATURES}')
+    if model.input_size != len(FEATURES):
+        raise ValueError(f'{model_path} takes {model.input_size} features, expected {len(FEATURES)}')
+    if "scaler" in metadata:
+        fold_scaler(model, FeatureScaler.from_state_dict(metadata["scaler"]))
+    if quantized:
+        return quantize(model), torch.device('cpu')
     return model, device
 
 def predict_next_hour(model, recent_sequence, device):
@@ -24,113 +53,103 @@ def predict_next_hour(model, recent_sequence, device):
 def predict_multiple_hours(model, input_sequence, device, hours=10):
     """Predict values for multiple future hours"""
     model.eval()
-    predictions = []
-    
-    with torch.no_grad():
-        current_sequence = input_sequence.copy()
-        for _ in range(hours):
-            # Predict next hour
-            pred = predict_next_hour(model, current_sequence, device)
-            predictions.append({
-                'P_wind': float(pred[0]),
-                'P_solar': float(pred[1]),
-                'house_consumption': float(pred[2])
-            })
-            # Update sequence
-            current_sequence = current_sequence[1:] + [list(pred)]
-    
-    return predictions
+    predictions = rollout(model, input_sequence, device, hours=hours)
+    return [dict(zip(FEATURES, row)) for row in predictions[0].cpu().tolist()]
 
 import numpy as np
 
-def calculate_trade_action(storage, future_predictions, capacity_max=30.0):
+ACTIONS = ('hold', 'buy', 'sell')
+REASONS = (
+    "Stable storage levels or low confidence predictions",
+    "Low storage with high confidence",
+    "Low storage with negative trend",
+    "High storage with high confidence",
+    "High storage with positive trend",
+)
+
+def project_storage(storage, delta, capacity_max=30.0):
+    """Clamped storage paths (N, horizon + 1) starting from (N,) storage for (N, horizon) net changes"""
+    storage = np.asarray(storage, dtype=np.float64)
+    capacity_max = np.broadcast_to(np.asarray(capacity_max, dtype=np.float64), storage.shape)
+    future_storage = np.empty(delta.shape[:1] + (delta.shape[1] + 1,))
+    future_storage[:, 0] = storage
+    for t in range(delta.shape[1]):
+        future_storage[:, t + 1] = np.clip(future_storage[:, t] + delta[:, t], 0, capacity_max)
+    return future_storage
+
+def batch_trade_action(storage, forecasts, capacity_max=30.0, rng=None):
     """
-    Aggressive oscillation with:
-    - 20-hour forecast window
-    - Looser buy/sell thresholds
-    - Random noise for simulation volatility
+    Trading decisions for N scenarios at once.
+
+    storage is an (N,) array, forecasts an (N, horizon, 3) array and
+    capacity_max a scalar or (N,) array. Returns a dict of (N,) arrays
+    (action and reason as indices into ACTIONS / REASONS, amount, confidence)
+    and the (N, horizon + 1) projected storage. Noise is drawn from rng
+    (a np.random.Generator) when given, otherwise from the global NumPy RNG.
     """
-    # Initialize storage projection
-    future_storage = [storage]
-    confidence_scores = []
-    
-    # Calculate future storage projections with confidence
-    for p in future_predictions:
-        # Add uncertainty based on prediction variance
-        noise = np.random.normal(0, 0.01)
-        delta = p[0] + p[1] - p[2] + noise
-        
-        # Calculate confidence based on prediction stability
-        confidence = 1 - abs(noise)  # Higher confidence for stable predictions
-        confidence_scores.append(confidence)
-        
-        next_val = max(0, min(capacity_max, future_storage[-1] + delta))
-        future_storage.append(next_val)
-    
-    # Calculate key metrics
-    min_future = min(future_storage)
-    max_future = max(future_storage)
-    avg_confidence = np.mean(confidence_scores)
-    storage_trend = np.polyfit(range(len(future_storage)), future_storage, 1)[0]
-    
-    # Dynamic threshold adjustment based on confidence
-    confidence_factor = 0.1 + 0.2 * avg_confidence  # 0.1 to 0.3 range
-    
+    storage = np.asarray(storage, dtype=np.float64)
+    forecasts = np.asarray(forecasts, dtype=np.float64)
+    capacity_max = np.broadcast_to(np.asarray(capacity_max, dtype=np.float64), storage.shape)
+    n, horizon = forecasts.shape[:2]
+
+    # Add uncertainty based on prediction variance
+    noise = rng.normal(0, 0.01, (n, horizon)) if rng is not None else np.random.normal(0, 0.01, (n, horizon))
+    delta = forecasts[:, :, 0] + forecasts[:, :, 1] - forecasts[:, :, 2] + noise
+    # Higher confidence for stable predictions
+    avg_confidence = np.mean(1 - np.abs(noise), axis=1)
+
+    future_storage = project_storage(storage, delta, capacity_max)
+    min_future = future_storage.min(axis=1)
+    max_future = future_storage.max(axis=1)
+
+    # Least-squares slope of the projection (closed form of np.polyfit(x, y, 1)[0])
+    x = np.arange(horizon + 1) - horizon / 2
+    storage_trend = future_storage @ (x / np.sum(x * x))
+
     # Risk management thresholds
     risk_threshold = 0.7 * capacity_max
     safety_threshold = 0.3 * capacity_max
-    
-    # Market trend analysis
-    trend_strength = abs(storage_trend) * 10  # Scale trend for decision making
-    
-    # Trading decision logic
-    if storage < safety_threshold and min_future < safety_threshold * 1.2:
-        # High confidence buy signal
-        if avg_confidence > 0.8:
-            buy_amount = min(0.6 * capacity_max - storage, 5)
-            return {
-                "action": "buy",
-                "amount": round(buy_amount, 2),
-                "confidence": round(avg_confidence, 2),
-                "reason": "Low storage with high confidence"
-            }, future_storage
-        
-        # Moderate confidence buy with trend consideration
-        elif avg_confidence > 0.6 and storage_trend < 0:
-            buy_amount = min(0.5 * capacity_max - storage, 3)
-            return {
-                "action": "buy",
-                "amount": round(buy_amount, 2),
-                "confidence": round(avg_confidence, 2),
-                "reason": "Low storage with negative trend"
-            }, future_storage
-    
-    elif storage > risk_threshold and max_future > risk_threshold * 1.1:
-        # High confidence sell signal
-        if avg_confidence > 0.8:
-            sell_amount = min(storage - 0.4 * capacity_max, 5)
-            return {
-                "action": "sell",
-                "amount": round(sell_amount, 2),
-                "confidence": round(avg_confidence, 2),
-                "reason": "High storage with high confidence"
-            }, future_storage
-        
-        # Moderate confidence sell with trend consideration
-        elif avg_confidence > 0.6 and storage_trend > 0:
-            sell_amount = min(storage - 0.5 * capacity_max, 3)
-            return {
-                "action": "sell",
-                "amount": round(sell_amount, 2),
-                "confidence": round(avg_confidence, 2),
-                "reason": "High storage with positive trend"
-            }, future_storage
-    
-    # Hold decision with detailed analysis
+
+    low = (storage < safety_threshold) & (min_future < safety_threshold * 1.2)
+    high = ~low & (storage > risk_threshold) & (max_future > risk_threshold * 1.1)
+    confident = avg_confidence > 0.8
+    moderate = ~confident & (avg_confidence > 0.6)
+
+    conditions = [
+        low & confident,
+        low & moderate & (storage_trend < 0),
+        high & confident,
+        high & moderate & (storage_trend > 0),
+    ]
+    reason = np.select(conditions, [1, 2, 3, 4], default=0)
+    action = np.select(conditions, [1, 1, 2, 2], default=0)
+    amount = np.select(conditions, [
+        np.minimum(0.6 * capacity_max - storage, 5),
+        np.minimum(0.5 * capacity_max - storage, 3),
+        np.minimum(storage - 0.4 * capacity_max, 5),
+        np.minimum(storage - 0.5 * capacity_max, 3),
+    ], default=0)
+
     return {
-        "action": "hold",
-        "amount": 0,
-        "confidence": round(avg_confidence, 2),
-        "reason": "Stable storage levels or low confidence predictions"
+        "action": action,
+        "amount": np.round(amount, 2),
+        "confidence": np.round(avg_confidence, 2),
+        "reason": reason
     }, future_storage
 
+def calculate_trade_action(storage, future_predictions, capacity_max=30.0):
+    """
+    Aggressive oscillation with:
+    - 20-hour forecast window
+    - Looser buy/sell thresholds
+    - Random noise for simulation volatility
+    """
+    future_predictions = np.asarray(future_predictions, dtype=np.float64).reshape(1, -1, 3)
+    decision, future_storage = batch_trade_action([storage], future_predictions, capacity_max)
+
+    return {
+        "action": ACTIONS[decision["action"][0]],
+        "amount": float(decision["amount"][0]),
+        "confidence": float(decision["confidence"][0]),
+        "reason": REASONS[decision["reason"][0]]
+    }, future_storage[0].tolist()
@@ -0,0 +1,105 @@
+import copy
+import time
+
+import numpy as np
+
+from predict import rollout, project_storage
+
+
+class ScenarioEngine:
+    """
+    Monte Carlo storage-risk estimates for one tick.
+
+    Draws many perturbed forecast trajectories around the model's forecast,
+    projects the storage along each one and reports quantile bands of the
+    projected storage and the probability of running empty or hitting the
+    capacity within the horizon.
+
+    Trajectories come from one of two sources:
+
+    - 'bootstrap': whole horizon-long residual trajectories (actual minus
+      forecast) resampled from the test split, added to the forecast.
+    - 'mc_dropout': batched rollouts of the history window through a copy of
+      LSTMPredictor kept in train mode, so its dropout layers stay active.
+
+    Samples are drawn in chunks until `samples` is reached or the per-tick
+    budget_ms is spent, whichever comes first.
+    """
+
+    def __init__(self, method='bootstrap', samples=2000, budget_ms=20, quantiles=(0.05, 0.5, 0.95),
+                 model=None, device=None, chunk_size=None, seed=None):
+        self.method = method
+        self.samples = samples
+        self.budget = budget_ms / 1000
+        self.quantiles = quantiles
+        self.device = device
+        # A dropout chunk is a full batched rollout, so keep it small enough to stop near the budget
+        self.chunk_size = chunk_size or (64 if method == 'mc_dropout' else 500)
+        self.rng = np.random.default_rng(seed)
+        self.residuals = None
+
+        self.dropout_model = None
+        if method == 'mc_dropout':
+            # Never toggle the serving model into train mode, other threads use it
+            self.dropout_model = copy.deepcopy(model).train()
+
+    def set_model(self, model):
+        """Follow a new serving model, e.g. after an online weight swap"""
+        if self.method == 'mc_dropout':
+            self.dropout_model = copy.deepcopy(model).train()
+
+    @property
+    def ready(self):
+        return self.method == 'mc_dropout' or self.residuals is not None
+
+    def fit_residuals(self, data, forecasts, train_split=0.8):
+        """
+        Collect residual trajectories from the test split.
+
+        forecasts[i] is the (horizon, 3) forecast made at row i of data, that is
+        the forecast for rows i + 1 .. i + horizon.
+        """
+        horizon = forecasts.shape[1]
+        rows = np.arange(int(len(data) * train_split), len(data) - horizon)
+        targets = data[rows[:, None] + 1 + np.arange(horizon)]
+        self.residuals = (targets - forecasts[rows, :horizon]).astype(np.float32)
+
+    def _draw(self, forecast, window, count):
+        if self.method == 'mc_dropout':
+            windows = np.broadcast_to(window, (count,) + window.shape)
+            return rollout(self.dropout_model, windows, self.device, hours=len(forecast)).cpu().numpy()
+
+        picks = self.rng.integers(0, len(self.residuals), count)
+        return forecast[None] + self.residuals[picks, :len(forecast)]
+
+    def sample(self, forecast, window=None):
+        """(samples, horizon, 3) perturbed trajectories within the latency budget"""
+        start = time.perf_counter()
+        chunks = []
+        drawn = 0
+        while drawn < self.samples:
+            chunks.append(self._draw(forecast, window, min(self.chunk_size, self.samples - drawn)))
+            drawn += len(chunks[-1])
+            if time.perf_counter() - start > self.budget:
+                break
+        return np.concatenate(chunks)
+
+    def estimate(self, storage, forecast, window=None, capacity_max=30.0):
+        """Risk summary for the current storage and (horizon, 3) forecast, or None if not ready"""
+        if not self.ready:
+            return None
+        start = time.perf_counter()
+        trajectories = self.sample(np.asarray(forecast, dtype=np.float32), window)
+
+        delta = trajectories[:, :, 0] + trajectories[:, :, 1] - trajectories[:, :, 2]
+        paths = project_storage(np.full(len(trajectories), storage), delta, capacity_max)[:, 1:]
+        bands = np.quantile(paths, self.quantiles, axis=0)
+
+        return {
+            "method": self.method,
+            "samples": len(trajectories),
+            "p_empty": float(np.mean((paths <= 0).any(axis=1))),
+            "p_full": float(np.mean((paths >= capacity_max).any(axis=1))),
+            "bands": {f"p{round(q * 100):02d}": band.tolist() for q, band in zip(self.quantiles, bands)},
+            "elapsed_ms": (time.perf_counter() - start) * 1000
+        }
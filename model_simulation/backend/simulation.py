@@ -0,0 +1,248 @@
+import asyncio
+import math
+
+import numpy as np
+
+from data_handler import HistoryBuffer
+from frames import DATETIME_FORMAT, Frame, FrameCodec
+from predict import FEATURES
+
+# Hours ahead forecast for every replayed hour
+FORECAST_HOURS = 10
+
+
+class Subscriber:
+    """Bounded send queue for one WebSocket connection"""
+
+    def __init__(self, queue_size):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = False
+
+    def offer(self, message):
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def close(self):
+        # Make room for the sentinel so the consumer wakes up and disconnects
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    async def get(self):
+        """Next Frame, or None once the subscriber has been dropped"""
+        return await self.queue.get()
+
+
+class SimulationEngine:
+    """
+    Replays one scenario on a single clock and fans every tick out to all of
+    its subscribers.
+
+    Each tick is computed once (forecast, storage update, recommendation) and
+    serialized at most once per wire format (frames.py), so the cost per tick
+    does not depend on how many clients are watching. Subscribers that fall
+    more than queue_size frames behind are dropped instead of slowing the
+    clock down. The engine only runs while it has subscribers and resumes
+    from the same hour when the next one joins.
+
+    The clock replays `speed` hours per wall-clock second against fixed
+    deadlines, so inference time does not accumulate as drift. At most
+    max_frame_rate frames are sent per second: faster speeds advance every
+    hour that is due at a wakeup in one step, with a single batched
+    forecast, and publish one frame covering all of them. When a wakeup
+    finds more than max_catch_up_frames frames' worth of hours due, the
+    clock slips instead of bursting through the backlog.
+
+    An online learner (online.OnlineTrainer), when given, is shown every
+    replayed row.
+    """
+
+    def __init__(self, name, data, datetime_index, storage, batcher, executor,
+                 trade_action, cache=None, risk=None, speed=1, max_frame_rate=20, max_catch_up_frames=4,
+                 queue_size=8, reason_templates=(), learner=None):
+        self.name = name
+        self.data = data
+        self.datetime_index = datetime_index
+        self.storage = storage
+        self.batcher = batcher
+        self.executor = executor
+        self.trade_action = trade_action
+        self.cache = cache
+        self.risk = risk
+        self.learner = learner
+        self.speed = speed
+        self.frame_interval = max(1 / speed, 1 / max_frame_rate)
+        self.max_hours_per_step = max_catch_up_frames * math.ceil(speed * self.frame_interval)
+        self.queue_size = queue_size
+
+        self.subscribers = set()
+        self.index = 0
+
+        # Real rolling context: seed with the hours preceding the first replayed row
+        self.history = HistoryBuffer(seq_length=24, num_features=data.shape[1])
+        for j in range(self.index - 23, self.index):
+            self.history.append(data[j % len(data)])
+        self.dropped_subscribers = 0
+        self.frames = 0
+        self.clock_slips = 0
+        self.lag = 0.0
+        self._task = None
+
+        # Binary layout of this scenario's frames, see frames.py
+        self.codec = FrameCodec(
+            start=datetime_index[0].strftime(DATETIME_FORMAT),
+            period=len(datetime_index),
+            quantiles=risk.quantiles if risk is not None else (0.05, 0.5, 0.95),
+            risk_method=risk.method if risk is not None else None,
+            reason_templates=reason_templates
+        )
+        self._last_frame = None
+
+    def subscribe(self):
+        subscriber = Subscriber(self.queue_size)
+        self.subscribers.add(subscriber)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+        if not self.subscribers and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def publish(self, message):
+        for subscriber in list(self.subscribers):
+            if not subscriber.offer(message):
+                # Drop slow consumers rather than buffering without bound
+                subscriber.dropped = True
+                subscriber.close()
+                self.subscribers.discard(subscriber)
+                self.dropped_subscribers += 1
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        origin = loop.time()
+        start = self.index
+        while True:
+            now = loop.time()
+            # Hours whose deadline origin + k / speed has passed
+            due = int((now - origin) * self.speed + 1e-9) + 1 - (self.index - start)
+            hours = max(1, min(due, self.max_hours_per_step))
+            if due > self.max_hours_per_step:
+                # Too far behind: move the clock instead of replaying the backlog in bursts
+                origin += (due - hours) / self.speed
+                self.clock_slips += 1
+            # How late the newest hour of this step is against its deadline
+            self.lag = max(0.0, now - (origin + (self.index + hours - 1 - start) / self.speed))
+
+            tick = self.index + hours - 1
+            payload = await self.advance(hours)
+            self._last_frame = Frame(self.codec, tick, payload, self._last_frame)
+            self.publish(self._last_frame)
+            self.frames += 1
+
+            deadline = max(origin + (self.index - start) / self.speed, now + self.frame_interval)
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+
+    async def tick(self):
+        """Advance the scenario by one hour and return the payload for that hour"""
+        return await self.advance(1)
+
+    async def advance(self, hours=1):
+        """
+        Advance the scenario by `hours` and return one payload covering them.
+
+        real and predict are averaged over the hours; datetime, storage, the
+        recommendation and future_storages are those of the last hour.
+        """
+        i = self.index
+        rows = self.data[np.arange(i, i + hours) % len(self.data)]
+        now_time = self.datetime_index[(i + hours - 1) % len(self.datetime_index)]
+
+        # Windows ending at each new row, read without touching the history yet
+        context = np.concatenate([self.history.window(), rows])
+        seq_length = self.history.seq_length
+        forecasts = [self.cache.get(i + k, FORECAST_HOURS) if self.cache is not None else None for k in range(hours)]
+        missing = {k: context[k + 1:k + 1 + seq_length] for k in range(hours) if forecasts[k] is None}
+        window = context[-seq_length:]
+        forecasts = await self.forecast(i, forecasts, missing)
+        forecast = forecasts[-1]
+
+        # The clock, the history and the storage move together after the last await
+        # before them, so cancelling a step (unsubscribe) never skips hours
+        for row in rows.tolist():
+            current_data = dict(zip(FEATURES, row))
+            self.storage.update_storage(
+                wind_generation=current_data['P_wind'],
+                solar_generation=current_data['P_solar'],
+                consumption=current_data['house_consumption']
+            )
+        for row in rows:
+            self.history.append(row)
+        self.index += hours
+        if self.learner is not None:
+            self.learner.observe(rows)
+
+        future_predictions = [dict(zip(FEATURES, row)) for row in forecast.tolist()]
+        recommendation, future_storages = await asyncio.get_running_loop().run_in_executor(
+            self.executor, self.trade_action, self.storage.storage, future_predictions)
+
+        risk = None
+        if self.risk is not None:
+            risk = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.risk.estimate, self.storage.storage, forecast, window)
+
+        # Calculate storage statistics
+        storage_stats = {
+            "current": self.storage.storage,
+            "min_24h": min(future_storages),
+            "max_24h": max(future_storages)
+        }
+
+        if hours == 1:
+            real, predicted = rows[0].tolist(), forecast[0].tolist()
+        else:
+            real = rows.mean(axis=0, dtype=np.float64).tolist()
+            predicted = np.mean([f[0] for f in forecasts], axis=0, dtype=np.float64).tolist()
+
+        return {
+            "datetime": now_time.strftime('%Y-%m-%d %H:%M'),
+            "hours": hours,
+            "real": dict(zip(FEATURES, real)),
+            "predict": dict(zip(FEATURES, predicted)),
+            "storage": self.storage.storage,
+            "recommendation": {
+                **recommendation,
+                "storage_stats": storage_stats,
+                "risk": risk
+            },
+            "future_storages": future_storages[1:]  # drop current
+        }
+
+    async def forecast(self, i, forecasts, missing):
+        """
+        Fill in the (FORECAST_HOURS, 3) forecasts of replay rows i, i + 1, ... that the
+        cache did not have. missing maps their offset to the history window;
+        they are submitted together so the batcher runs them as one batch.
+        """
+        results = await asyncio.gather(*(self.batcher.submit(window, hours=FORECAST_HOURS) for window in missing.values()))
+        for k, forecast in zip(missing, results):
+            forecasts[k] = forecast
+            if self.cache is not None:
+                self.cache.put(i + k, forecast)
+        return forecasts
+
+    def metrics(self):
+        return {
+            "subscribers": len(self.subscribers),
+            "hour": self.index,
+            "speed": self.speed,
+            "frames": self.frames,
+            "clock_lag_ms": self.lag * 1000,
+            "clock_slips": self.clock_slips,
+            "dropped_subscribers": self.dropped_subscribers
+        }
@@ -1,6 +1,7 @@
 'use client';
 import { useEffect, useState } from 'react';
 import { AreaChart, Area, CartesianGrid, XAxis, YAxis, Tooltip, Legend, ResponsiveContainer } from 'recharts';
+import { createFrameDecoder } from '../utils/frames';
 
 export default function RealTimeChart() {
   const [data, setData] = useState([]);
@@ -26,7 +27,10 @@ export default function RealTimeChart() {
     let reconnectTimeout = null;
 
     const connectWebSocket = () => {
-      socket = new WebSocket('ws://127.0.0.1:8000/ws');
+      // Compact binary frames: a schema first, then keyframe/delta ticks
+      socket = new WebSocket('ws://127.0.0.1:8000/ws?encoding=binary');
+      socket.binaryType = 'arraybuffer';
+      let decodeFrame = null;
       
       socket.onopen = () => {
         console.log('WebSocket connected successfully');
@@ -34,7 +38,16 @@ export default function RealTimeChart() {
       
     socket.onmessage = (event) => {
         try {
-      const receivedData = JSON.parse(event.data);
+      let receivedData;
+      if (typeof event.data === 'string') {
+        receivedData = JSON.parse(event.data);
+        if (receivedData.type === 'schema') {
+          decodeFrame = createFrameDecoder(receivedData);
+          return;
+        }
+      } else {
+        receivedData = decodeFrame(event.data);
+      }
       setData(prevData => [
         ...prevData.slice(-20),
         {
@@ -0,0 +1,87 @@
+// Decoder for the binary /ws stream (/ws?encoding=binary), see backend/frames.py.
+// The first message of a session is a JSON schema; every later one is a
+// binary keyframe or delta that decodes to the same payload object the JSON
+// stream sends.
+const KEYFRAME = 1;
+const REASON = 1;
+const RISK = 2;
+const TEMPLATE = 4;
+const HEADER_BYTES = 9;
+
+const indexed = (node) => Object.keys(node).sort((a, b) => a - b).map((key) => node[key]);
+
+export const createFrameDecoder = (schema) => {
+  const textDecoder = new TextDecoder();
+  const start = Date.parse(`${schema.datetime.start.replace(' ', 'T')}:00Z`);
+  let values = null;
+  let reason = null;
+
+  return (buffer) => {
+    const view = new DataView(buffer);
+    const kind = view.getUint8(0);
+    const flags = view.getUint8(1);
+    const count = view.getUint16(2, true);
+    const tick = view.getUint32(4, true);
+    const action = view.getUint8(8);
+    let offset = HEADER_BYTES;
+
+    if (kind === KEYFRAME) {
+      values = new Float32Array(count);
+      for (let i = 0; i < count; i++, offset += 4) {
+        values[i] = view.getFloat32(offset, true);
+      }
+    } else {
+      // Only the fields whose bit is set in the mask are sent
+      const mask = offset;
+      offset += Math.ceil(count / 8);
+      for (let i = 0; i < count; i++) {
+        if (view.getUint8(mask + (i >> 3)) & (1 << (i & 7))) {
+          values[i] = view.getFloat32(offset, true);
+          offset += 4;
+        }
+      }
+    }
+
+    if (flags & (REASON | TEMPLATE)) {
+      let template = null;
+      if (flags & TEMPLATE) {
+        template = schema.reason_templates[view.getUint8(offset)];
+        offset += 1;
+      }
+      const length = view.getUint16(offset, true);
+      offset += 2;
+      reason = textDecoder.decode(new Uint8Array(buffer, offset, length));
+      if (template !== null) {
+        const args = Object.fromEntries(
+          reason ? reason.split('\x1f').map((arg) => [arg.slice(0, arg.indexOf('=')), arg.slice(arg.indexOf('=') + 1)]) : []
+        );
+        reason = template.replace(/\{(\w+)\}/g, (_, name) => args[name]);
+      }
+    }
+
+    const payload = {};
+    schema.fields.forEach((name, i) => {
+      if (name.startsWith('recommendation.risk.') && !(flags & RISK)) return;
+      const path = name.split('.');
+      const leaf = path.pop();
+      let node = payload;
+      for (const key of path) node = node[key] ??= {};
+      node[leaf] = values[i];
+    });
+
+    const when = new Date(start + (tick % schema.datetime.period) * 3600 * 1000);
+    payload.datetime = when.toISOString().slice(0, 16).replace('T', ' ');
+    payload.future_storages = indexed(payload.future_storages);
+    const recommendation = payload.recommendation;
+    recommendation.action = schema.actions[action];
+    recommendation.reason = reason;
+    if (flags & RISK) {
+      const risk = recommendation.risk;
+      risk.method = schema.risk_method;
+      risk.bands = Object.fromEntries(Object.entries(risk.bands).map(([band, steps]) => [band, indexed(steps)]));
+    } else {
+      recommendation.risk = null;
+    }
+    return payload;
+  };
+};
@@ -1,7 +1,16 @@
-import pandas as pd
+import argparse
+import json
+import os
+
 import numpy as np
+import pandas as pd
 from sklearn.preprocessing import MinMaxScaler
-import os
+
+# Wind turbine power curve: data points from the chart (m/s -> kW)
+WIND_SPEEDS = np.array([1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 23, 24, 25], dtype=np.float64)
+POWER_OUTPUTS = np.array([0, 0, 0, 0.25, 0.8, 1.65, 2.55, 3.65, 4.85, 6.15, 7.5, 9, 9.5, 10, 8, 6, 2.7, 3, 3, 3, 3, 3, 3, 3, 3], dtype=np.float64)
+
+DEFAULT_CHUNKSIZE = 500_000
 
 # Convert wind speed to power using the formula
 def wind_to_power(V):
@@ -12,124 +21,177 @@ def wind_to_power(V):
         V (float or np.array): Wind speed in m/s.
 
     Returns:
-        P (float or np.array): Power output in kW.
+        P (float or np.array): Power output in kW, 0 outside the 1-25 m/s range.
     """
-    # Data points from the chart
-    wind_speeds = np.array([1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 23, 24, 25])
-    power_outputs = np.array([0, 0, 0, 0.25, 0.8, 1.65, 2.55, 3.65, 4.85, 6.15, 7.5, 9, 9.5, 10, 8, 6, 2.7, 3, 3, 3, 3, 3, 3, 3, 3])
-
-    # Handle single values or arrays
-    if isinstance(V, (int, float)):
-        if V < 1 or V > 25:
-            return 0
-        else:
-            return np.interp(V, wind_speeds, power_outputs)
-    else:
-        # For arrays, clip values outside the range and interpolate
-        V = np.clip(V, 1, 25)
-        return np.interp(V, wind_speeds, power_outputs)
+    V = np.asarray(V, dtype=np.float64)
+    P = np.where((V < 1) | (V > 25), 0.0, np.interp(V, WIND_SPEEDS, POWER_OUTPUTS))
+    return P if P.ndim else float(P)
 
 def dni_to_power(dni, efficiency=0.2, area=100):
     """
     Convert DNI to solar power output.
-    
+
     Parameters:
-        dni (float): Direct Normal Irradiance in W/m2
+        dni (float or array): Direct Normal Irradiance in W/m2
         efficiency (float): Solar panel efficiency (default 20%)
         area (float): Solar panel area in m2
-    
+
     Returns:
-        float: Power output in kW
+        float or array: Power output in kW
     """
     return dni * efficiency * area / 1000
 
-# Load and process solar data
-solar_data = pd.read_csv('D:/dataset/solardata/1216837_46.81_-74.86_tdy-2022.csv', skiprows=2)
-solar_data['datetime'] = pd.to_datetime({
-    'year': 2014,
-    'month': solar_data['Month'],
-    'day': solar_data['Day'],
-    'hour': solar_data['Hour'],
-    'minute': solar_data['Minute']
-})
-solar_data.set_index('datetime', inplace=True)
-
-# Calculate solar power and resample to hourly averages
-solar_data['P_solar'] = solar_data['DNI'].apply(dni_to_power)
-hourly_solar = solar_data['P_solar'].resample('h').mean()
-
-print(f"Solar data shape: {hourly_solar.shape}")
-
-# Load and process wind data
-wind_data = pd.read_csv('D:\dataset\winddata\wind_2018.csv', skiprows=1)
-wind_data['datetime'] = pd.to_datetime(wind_data[['Year', 'Month', 'Day', 'Hour']])
-wind_data.set_index('datetime', inplace=True)
-
-# Convert wind speed to power and resample to hourly averages
-wind_data['P_wind'] = wind_data['wind speed at 10m (m/s)'].apply(wind_to_power)
-hourly_wind = wind_data['P_wind'].resample('h').mean()
-
-print(f"Wind data shape: {hourly_wind.shape}")
-
-# Load house consumption data
-house_data = pd.read_csv('D:/dataset/Processed_Data_CSV/House_1.csv')
-house_data['datetime'] = pd.to_datetime(house_data['Time'])
-
-# Filter data for the year 2014
-start_date = pd.Timestamp('2014-01-01')
-end_date = pd.Timestamp('2015-01-01')
-house_data = house_data[(house_data['datetime'] >= start_date) & 
-                       (house_data['datetime'] < end_date)]
-
-house_data.set_index('datetime', inplace=True)
-
-# Resample house data to hourly averages
-hourly_house = house_data['Aggregate'].resample('h').mean()
-
-print(f"House data shape: {hourly_house.shape}")
-
-# Normalize all datasets
-scaler_wind = MinMaxScaler()
-scaler_solar = MinMaxScaler()
-scaler_house = MinMaxScaler()
-
-hourly_wind_normalized = scaler_wind.fit_transform(hourly_wind.values.reshape(-1, 1))
-hourly_solar_normalized = scaler_solar.fit_transform(hourly_solar.values.reshape(-1, 1))
-hourly_house_normalized = scaler_house.fit_transform(hourly_house.values.reshape(-1, 1))
-
-print(f"Normalized wind shape: {hourly_wind_normalized.shape}")
-print(f"Normalized solar shape: {hourly_solar_normalized.shape}")
-print(f"Normalized house shape: {hourly_house_normalized.shape}")
-
-# Convert back to series with datetime index
-hourly_wind_normalized = pd.Series(hourly_wind_normalized.flatten(), index=hourly_wind.index)
-hourly_solar_normalized = pd.Series(hourly_solar_normalized.flatten(), index=hourly_solar.index)
-hourly_house_normalized = pd.Series(hourly_house_normalized.flatten(), index=hourly_house.index)
-
-# Align all data to the same year
-hourly_wind_normalized.index = hourly_wind_normalized.index.map(lambda x: x.replace(year=2014))
-
-print(f"Wind data range: {hourly_wind_normalized.index.min()} to {hourly_wind_normalized.index.max()}")
-print(f"Solar data range: {hourly_solar_normalized.index.min()} to {hourly_solar_normalized.index.max()}")
-print(f"House data range: {hourly_house_normalized.index.min()} to {hourly_house_normalized.index.max()}")
-
-# Combine all datasets
-combined_data = pd.concat([hourly_wind_normalized, hourly_solar_normalized, hourly_house_normalized], axis=1)
-combined_data.columns = ['P_wind', 'P_solar', 'house_consumption']
-combined_data.dropna(inplace=True)
-
-print(f"Combined data shape: {combined_data.shape}")
-
-# Create output directory if it doesn't exist
-output_dir = 'D:/dataset/output'
-if not os.path.exists(output_dir):
-    os.makedirs(output_dir)
-
-# Create output filename with descriptive information
-start_date_str = start_date.strftime('%m%d')
-end_date_str = (start_date + pd.DateOffset(years=1) - pd.DateOffset(days=1)).strftime('%m%d')
-output_filename = f'processed_data_{start_date_str}_to_{end_date_str}.csv'
-output_file = os.path.join(output_dir, output_filename)
-combined_data.to_csv(output_file)
+def hourly_mean(chunks):
+    """
+    Hourly average of a stream of datetime-indexed Series.
 
-print(f"Data saved to: {output_file}")
\ No newline at end of file
+    Only per-hour sums and counts are kept between chunks, so arbitrarily long
+    minute-resolution inputs are reduced in bounded memory. The result has the
+    same full hourly index as Series.resample('h').mean().
+    """
+    sums = []
+    for series in chunks:
+        hours = series.index.floor('h')
+        sums.append(series.groupby(hours).agg(['sum', 'count']))
+    totals = pd.concat(sums).groupby(level=0).sum()
+
+    mean = totals['sum'] / totals['count'].where(totals['count'] > 0)
+    full_range = pd.date_range(mean.index.min(), mean.index.max(), freq='h')
+    return mean.reindex(full_range)
+
+def load_solar(path, year=2014, chunksize=DEFAULT_CHUNKSIZE):
+    """Hourly solar power (kW) from an NSRDB TDY file, stamped with `year`"""
+    def chunks():
+        for chunk in pd.read_csv(path, skiprows=2, chunksize=chunksize,
+                                 usecols=['Month', 'Day', 'Hour', 'Minute', 'DNI']):
+            index = pd.DatetimeIndex(pd.to_datetime({
+                'year': year,
+                'month': chunk['Month'],
+                'day': chunk['Day'],
+                'hour': chunk['Hour'],
+                'minute': chunk['Minute']
+            }))
+            yield pd.Series(dni_to_power(chunk['DNI'].to_numpy(dtype=np.float64)), index=index)
+    return hourly_mean(chunks())
+
+def load_wind(path, chunksize=DEFAULT_CHUNKSIZE):
+    """Hourly wind power (kW) from a wind speed file"""
+    speed_column = 'wind speed at 10m (m/s)'
+    def chunks():
+        for chunk in pd.read_csv(path, skiprows=1, chunksize=chunksize,
+                                 usecols=['Year', 'Month', 'Day', 'Hour', speed_column]):
+            index = pd.DatetimeIndex(pd.to_datetime(chunk[['Year', 'Month', 'Day', 'Hour']]))
+            yield pd.Series(wind_to_power(chunk[speed_column].to_numpy(dtype=np.float64)), index=index)
+    return hourly_mean(chunks())
+
+def load_house(path, start_date, end_date, chunksize=DEFAULT_CHUNKSIZE, cache_dir=None):
+    """Hourly house consumption between start_date and end_date from a REFIT house file"""
+    if cache_dir is not None:
+        # Reuse the hourly columns written by ingest.py instead of re-parsing the file
+        from ingest import ingest
+        hourly = next(iter(ingest([path], cache_dir, workers=1, chunksize=chunksize).values()))
+        hourly = hourly[(hourly.index >= start_date) & (hourly.index < end_date)].dropna()
+        full_range = pd.date_range(hourly.index.min(), hourly.index.max(), freq='h')
+        return hourly.reindex(full_range).astype(np.float64)
+
+    def chunks():
+        for chunk in pd.read_csv(path, chunksize=chunksize, usecols=['Time', 'Aggregate']):
+            index = pd.DatetimeIndex(pd.to_datetime(chunk['Time']))
+            mask = np.asarray((index >= start_date) & (index < end_date))
+            if mask.any():
+                yield pd.Series(chunk['Aggregate'].to_numpy(dtype=np.float64)[mask], index=index[mask])
+    return hourly_mean(chunks())
+
+def normalize(series):
+    """Scale a Series to [0, 1] with its own MinMaxScaler"""
+    scaled = MinMaxScaler().fit_transform(series.values.reshape(-1, 1))
+    return pd.Series(scaled.flatten(), index=series.index)
+
+def align_year(index, year):
+    """Move every timestamp of a DatetimeIndex to the same month/day/time in `year`"""
+    return pd.DatetimeIndex(pd.to_datetime({
+        'year': np.full(len(index), year),
+        'month': index.month,
+        'day': index.day,
+        'hour': index.hour,
+        'minute': index.minute,
+        'second': index.second
+    }))
+
+def preprocess(solar_path, wind_path, house_path, year=2014, chunksize=DEFAULT_CHUNKSIZE, cache_dir=None):
+    """Combined normalized hourly P_wind / P_solar / house_consumption for one year"""
+    start_date = pd.Timestamp(year=year, month=1, day=1)
+    end_date = start_date + pd.DateOffset(years=1)
+
+    hourly_solar = load_solar(solar_path, year, chunksize)
+    print(f"Solar data shape: {hourly_solar.shape}")
+
+    hourly_wind = load_wind(wind_path, chunksize)
+    print(f"Wind data shape: {hourly_wind.shape}")
+
+    hourly_house = load_house(house_path, start_date, end_date, chunksize, cache_dir)
+    print(f"House data shape: {hourly_house.shape}")
+
+    # Raw kW range of each feature, so normalized values can be mapped back to kW
+    raw_range = {name: {"min": float(series.min()), "max": float(series.max())}
+                 for name, series in (('P_wind', hourly_wind), ('P_solar', hourly_solar),
+                                      ('house_consumption', hourly_house))}
+
+    # Normalize all datasets
+    hourly_wind_normalized = normalize(hourly_wind)
+    hourly_solar_normalized = normalize(hourly_solar)
+    hourly_house_normalized = normalize(hourly_house)
+
+    # Align all data to the same year
+    hourly_wind_normalized.index = align_year(hourly_wind_normalized.index, year)
+
+    print(f"Wind data range: {hourly_wind_normalized.index.min()} to {hourly_wind_normalized.index.max()}")
+    print(f"Solar data range: {hourly_solar_normalized.index.min()} to {hourly_solar_normalized.index.max()}")
+    print(f"House data range: {hourly_house_normalized.index.min()} to {hourly_house_normalized.index.max()}")
+
+    # Combine all datasets
+    combined_data = pd.concat([hourly_wind_normalized, hourly_solar_normalized, hourly_house_normalized], axis=1)
+    combined_data.columns = ['P_wind', 'P_solar', 'house_consumption']
+    combined_data.index.name = 'datetime'
+    combined_data.dropna(inplace=True)
+    combined_data.attrs['raw_range'] = raw_range
+
+    print(f"Combined data shape: {combined_data.shape}")
+    return combined_data
+
+def range_path(csv_path):
+    """Sidecar JSON with the raw kW min/max of each normalized column of a processed CSV"""
+    return os.path.splitext(csv_path)[0] + '.range.json'
+
+def output_path(output_dir, year=2014):
+    """Output filename with descriptive information, e.g. processed_data_0101_to_1231.csv"""
+    start_date = pd.Timestamp(year=year, month=1, day=1)
+    start_date_str = start_date.strftime('%m%d')
+    end_date_str = (start_date + pd.DateOffset(years=1) - pd.DateOffset(days=1)).strftime('%m%d')
+    return os.path.join(output_dir, f'processed_data_{start_date_str}_to_{end_date_str}.csv')
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the hourly wind/solar/house dataset used by the model')
+    parser.add_argument('--solar', default='D:/dataset/solardata/1216837_46.81_-74.86_tdy-2022.csv')
+    parser.add_argument('--wind', default='D:/dataset/winddata/wind_2018.csv')
+    parser.add_argument('--house', default='D:/dataset/Processed_Data_CSV/House_1.csv')
+    parser.add_argument('--output-dir', default='D:/dataset/output')
+    parser.add_argument('--year', type=int, default=2014)
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE,
+                        help='rows per read_csv chunk; bounds memory for large inputs')
+    parser.add_argument('--cache-dir', default=None, help='hourly house cache written by ingest.py')
+    args = parser.parse_args()
+
+    combined_data = preprocess(args.solar, args.wind, args.house, args.year, args.chunksize, args.cache_dir)
+
+    # Create output directory if it doesn't exist
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_file = output_path(args.output_dir, args.year)
+    combined_data.to_csv(output_file)
+    with open(range_path(output_file), 'w') as f:
+        json.dump(combined_data.attrs['raw_range'], f, indent=1)
+
+    print(f"Data saved to: {output_file}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Parallel hyperparameter sweep over LSTMPredictor configurations.
+
+The dataset is scaled once and cached as a float32 .npy that every worker
+memory-maps. Trials run in a process pool; each worker process is pinned to
+its own slice of CPU cores and sets torch's thread count to match. A median
+pruner stops trials whose validation loss is worse than the median of the
+other trials at the same epoch.
+
+Usage:
+    python sweep.py --hidden-sizes 32 64 128 --num-layers 1 2 --lrs 0.001 0.003 --workers 4
+"""
+import argparse
+import itertools
+import multiprocessing
+import os
+import random
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+
+from house_dataset import HouseConsumptionDataset, window_loader
+from house_model import LSTMPredictor, FeatureScaler, load_model
+from house_prediction import train_model
+
+
+def core_slices(workers):
+    """Split the CPUs available to this process into `workers` disjoint slices"""
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+    workers = max(1, min(workers, len(cores)))
+    return [cores[i::workers] for i in range(workers)]
+
+
+def _init_worker(slices):
+    # Each pool process takes one slice of cores for its whole lifetime
+    cores = slices.get()
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(len(cores))
+
+
+def should_prune(reports, lock, epoch, val_loss, warmup_epochs, min_trials):
+    """Record val_loss for epoch and report whether it is worse than the median of the other trials"""
+    with lock:
+        others = list(reports.get(epoch, []))
+        reports[epoch] = others + [val_loss]
+    if epoch <= warmup_epochs or len(others) < min_trials:
+        return False
+    return val_loss > statistics.median(others)
+
+
+def inference_latency(model, seq_length, num_features, runs=200):
+    """Median single-window forward latency in milliseconds"""
+    model.eval()
+    window = torch.rand(1, seq_length, num_features)
+    timings = []
+    with torch.no_grad():
+        for _ in range(runs):
+            start = time.perf_counter()
+            model(window)
+            timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def run_trial(trial_id, config, data_path, out_dir, epochs, patience, reports, lock,
+              warmup_epochs, min_trials, seed, scaler_state=None, features=None):
+    torch.manual_seed(seed + trial_id)
+    data = np.load(data_path, mmap_mode='c')
+    train_size = int(len(data) * 0.8)
+    train_dataset = HouseConsumptionDataset(data[:train_size], config['seq_length'])
+    test_dataset = HouseConsumptionDataset(data[train_size:], config['seq_length'])
+    train_loader = window_loader(train_dataset, batch_size=config['batch_size'], shuffle=True)
+    test_loader = window_loader(test_dataset, batch_size=config['batch_size'])
+
+    model = LSTMPredictor(input_size=data.shape[1], hidden_size=config['hidden_size'],
+                          num_layers=config['num_layers'])
+    optimizer = torch.optim.Adam(model.parameters(), lr=config['lr'])
+    best_path = os.path.join(out_dir, f'trial_{trial_id}.pth')
+
+    pruned = []
+    def on_epoch_end(entry):
+        if entry['val_loss'] is not None and should_prune(reports, lock, entry['epoch'], entry['val_loss'],
+                                                          warmup_epochs, min_trials):
+            pruned.append(entry['epoch'])
+            return True
+        return False
+
+    start = time.perf_counter()
+    history = train_model(model, train_loader, test_loader, nn.MSELoss(), optimizer, epochs,
+                          torch.device('cpu'), patience=patience, best_path=best_path,
+                          on_epoch_end=on_epoch_end,
+                          scaler=FeatureScaler.from_state_dict(scaler_state) if scaler_state else None,
+                          metadata={"features": features, "seq_length": config['seq_length']})
+    train_seconds = time.perf_counter() - start
+
+    model, _ = load_model(best_path)
+    return {
+        "trial": trial_id,
+        **config,
+        "best_val_loss": min(e['val_loss'] for e in history if e['val_loss'] is not None),
+        "epochs": len(history),
+        "pruned": bool(pruned),
+        "train_seconds": train_seconds,
+        "latency_ms": inference_latency(model, config['seq_length'], data.shape[1]),
+        "checkpoint": best_path
+    }
+
+
+def build_configs(args):
+    grid = [dict(zip(('hidden_size', 'num_layers', 'seq_length', 'lr', 'batch_size'), values))
+            for values in itertools.product(args.hidden_sizes, args.num_layers, args.seq_lengths,
+                                            args.lrs, args.batch_sizes)]
+    if args.samples is not None and args.samples < len(grid):
+        grid = random.Random(args.seed).sample(grid, args.samples)
+    return grid
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parallel hyperparameter sweep for LSTMPredictor')
+    parser.add_argument('--data', default='model_simulation/backend/data/processed_data_0101_to_1231.csv')
+    parser.add_argument('--out-dir', default='sweep_results')
+    parser.add_argument('--hidden-sizes', type=int, nargs='+', default=[32, 64, 128])
+    parser.add_argument('--num-layers', type=int, nargs='+', default=[1, 2])
+    parser.add_argument('--seq-lengths', type=int, nargs='+', default=[24])
+    parser.add_argument('--lrs', type=float, nargs='+', default=[0.001, 0.003])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[32])
+    parser.add_argument('--samples', type=int, default=None, help='random sample of this many grid points')
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--patience', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--prune-warmup', type=int, default=3, help='never prune before this epoch')
+    parser.add_argument('--prune-min-trials', type=int, default=3,
+                        help='trials that must have reported an epoch before pruning against it')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    # Scale once and share the result with every worker through a memory-mapped .npy
+    data_df = pd.read_csv(args.data, index_col=0)
+    data_path = os.path.join(args.out_dir, 'dataset.npy')
+    scaler = FeatureScaler()
+    np.save(data_path, scaler.fit_transform(data_df).astype(np.float32))
+
+    configs = build_configs(args)
+    slices = core_slices(args.workers)
+    print(f'{len(configs)} trials on {len(slices)} workers, cores per worker: {[len(s) for s in slices]}')
+
+    with multiprocessing.Manager() as manager:
+        reports, lock = manager.dict(), manager.Lock()
+        slice_queue = manager.Queue()
+        for cores in slices:
+            slice_queue.put(cores)
+
+        with ProcessPoolExecutor(max_workers=len(slices), initializer=_init_worker,
+                                 initargs=(slice_queue,)) as pool:
+            futures = [pool.submit(run_trial, i, config, data_path, args.out_dir, args.epochs,
+                                   args.patience, reports, lock, args.prune_warmup,
+                                   args.prune_min_trials, args.seed, scaler.state_dict(), list(data_df.columns))
+                       for i, config in enumerate(configs)]
+            results = [f.result() for f in futures]
+
+    table = pd.DataFrame(results).sort_values('best_val_loss')
+    table.to_csv(os.path.join(args.out_dir, 'results.csv'), index=False)
+    print(table.drop(columns='checkpoint').to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,76 +1,47 @@
+import argparse
 import pandas as pd
 import torch
 import torch.nn as nn
-from torch.utils.data import DataLoader
-from sklearn.preprocessing import MinMaxScaler
-
-class HouseConsumptionDataset(torch.utils.data.Dataset):
-    def __init__(self, data, seq_length):
-        self.data = torch.FloatTensor(data)
-        self.seq_length = seq_length
-
-    def __len__(self):
-        return len(self.data) - self.seq_length
-
-    def __getitem__(self, idx):
-        return (self.data[idx:idx + self.seq_length],
-                self.data[idx + self.seq_length])
-
-class LSTMPredictor(nn.Module):
-    def __init__(self, input_size=3, hidden_size=64, num_layers=2, dropout=0.2):
-        super(LSTMPredictor, self).__init__()
-        self.lstm = nn.LSTM(input_size, hidden_size, num_layers, dropout=dropout, batch_first=True)
-        self.linear = nn.Linear(hidden_size, input_size)
-    
-    def forward(self, x):
-        lstm_out, _ = self.lstm(x)
-        predictions = self.linear(lstm_out[:, -1, :])
-        return predictions
-
-data_df = pd.read_csv('model_simulation/backend/data/processed_data_0101_to_1231.csv', index_col=0)
-
-scaler = MinMaxScaler()
-scaled_data = scaler.fit_transform(data_df)
-
-SEQ_LENGTH = 24
-train_split = 0.8
-train_size = int(len(scaled_data) * train_split)
-train_data = scaled_data[:train_size]
-test_data = scaled_data[train_size:]
-
-train_dataset = HouseConsumptionDataset(train_data, SEQ_LENGTH)
-test_dataset = HouseConsumptionDataset(test_data, SEQ_LENGTH)
-
-train_loader = DataLoader(train_dataset, batch_size=32, shuffle=True)
-test_loader = DataLoader(test_dataset, batch_size=32)
-
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-
-model = LSTMPredictor(input_size=3).to(device)
-criterion = nn.MSELoss()
-optimizer = torch.optim.Adam(model.parameters(), lr=0.001)
-
-num_epochs = 30
-for epoch in range(num_epochs):
-    model.train()
-    train_loss = 0
-    for batch_x, batch_y in train_loader:
-        batch_x, batch_y = batch_x.to(device), batch_y.to(device)
-        optimizer.zero_grad()
-        outputs = model(batch_x)
-        loss = criterion(outputs, batch_y)
-        loss.backward()
-        optimizer.step()
-        train_loss += loss.item()
-
-    model.eval()
-    val_loss = 0
-    with torch.no_grad():
-        for batch_x, batch_y in test_loader:
-            batch_x, batch_y = batch_x.to(device), batch_y.to(device)
-            outputs = model(batch_x)
-            val_loss += criterion(outputs, batch_y).item()
-
-    print(f'Epoch [{epoch+1}/{num_epochs}], Train Loss: {train_loss/len(train_loader):.4f}, Val Loss: {val_loss/len(test_loader):.4f}')
-
-torch.save(model.state_dict(), 'model_simulation/backend/model/house_consumption_model_3d.pth')
+from house_dataset import window_loader
+from house_model import LSTMPredictor, DirectLSTMPredictor
+from house_prediction import prepare_data, train_model
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Train the 3-feature model served by the backend')
+    parser.add_argument('--data', default='model_simulation/backend/data/processed_data_0101_to_1231.csv')
+    parser.add_argument('--output', default='model_simulation/backend/model/house_consumption_model_3d.pth')
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--bf16', action='store_true', help='bfloat16 autocast for forward passes')
+    parser.add_argument('--compile', action='store_true', help='torch.compile the model')
+    parser.add_argument('--val-every', type=int, default=1, help='validate every N epochs')
+    parser.add_argument('--checkpoint-dir', default=None, help='write/resume checkpoints here')
+    parser.add_argument('--patience', type=int, default=None, help='stop after N validations without improvement')
+    parser.add_argument('--horizon', type=int, default=1,
+                        help='>1 trains a direct head that forecasts this many hours in one forward pass')
+    args = parser.parse_args()
+
+    SEQ_LENGTH = 24
+
+    data_df = pd.read_csv(args.data, index_col=0)
+    train_dataset, test_dataset, scaler = prepare_data(data_df, SEQ_LENGTH, horizon=args.horizon)
+
+    train_loader = window_loader(train_dataset, batch_size=args.batch_size, shuffle=True)
+    test_loader = window_loader(test_dataset, batch_size=args.batch_size)
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+    if args.horizon > 1:
+        model = DirectLSTMPredictor(input_size=3, horizon=args.horizon).to(device)
+    else:
+        model = LSTMPredictor(input_size=3).to(device)
+    criterion = nn.MSELoss()
+    optimizer = torch.optim.Adam(model.parameters(), lr=0.001)
+
+    # The best-by-validation weights are written to args.output with the architecture,
+    # features, seq_length and scaler embedded
+    train_model(model, train_loader, test_loader, criterion, optimizer, args.epochs, device,
+                bf16=args.bf16, compile_model=args.compile, val_every=args.val_every,
+                checkpoint_dir=args.checkpoint_dir, patience=args.patience,
+                best_path=args.output, scaler=scaler,
+                metadata={"features": list(data_df.columns), "seq_length": SEQ_LENGTH})